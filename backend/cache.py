@@ -0,0 +1,129 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import Response
+
+logger = logging.getLogger(__name__)
+
+# Stamped by 03_load_to_postgres.py in the same transaction as each load
+DATA_VERSION_QUERY = text("SELECT value FROM pipeline_metadata WHERE key = 'data_version'")
+
+
+class ResponseCache:
+    """Serialized API responses keyed by path, query string and data version.
+
+    The data version is re-read from Postgres at most once per `version_ttl`
+    seconds; when it changes every cached entry is dropped.
+    """
+
+    def __init__(self, engine, version_ttl=5.0, max_entries=1024):
+        self.engine = engine
+        self.version_ttl = version_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._entries = OrderedDict()
+        self._version = None
+        self._version_checked = float('-inf')
+        self._lock = threading.Lock()
+
+    def data_version(self):
+        now = time.monotonic()
+        if now - self._version_checked < self.version_ttl:
+            return self._version
+        try:
+            with self.engine.connect() as conn:
+                version = conn.execute(DATA_VERSION_QUERY).scalar()
+        except Exception as e:
+            # Loads made before versioning existed: serve uncached
+            if self._version is not None or self._version_checked == float('-inf'):
+                logger.warning(f"Data version unavailable, response cache bypassed: {e}")
+            version = None
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            self._version_checked = now
+        return version
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "data_version": self._version,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+            }
+
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates
+
+
+class ResponseCacheMiddleware(BaseHTTPMiddleware):
+    """Serves cached GET responses with strong ETags and If-None-Match → 304."""
+
+    def __init__(self, app, cache, paths):
+        super().__init__(app)
+        self.cache = cache
+        self.paths = set(paths)
+
+    async def dispatch(self, request, call_next):
+        if request.method != 'GET' or request.url.path not in self.paths:
+            return await call_next(request)
+
+        version = await run_in_threadpool(self.cache.data_version)
+        if version is None:
+            return await call_next(request)
+
+        key = (request.url.path, tuple(sorted(request.query_params.multi_items())), version)
+        if_none_match = request.headers.get('if-none-match')
+        entry = self.cache.get(key)
+        if entry is None:
+            response = await call_next(request)
+            if response.status_code != 200:
+                return response
+            body = b''.join([chunk async for chunk in response.body_iterator])
+            etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+            entry = (etag, body, response.media_type or response.headers.get('content-type'))
+            self.cache.put(key, entry)
+            cache_status = 'MISS'
+        else:
+            cache_status = 'HIT'
+
+        etag, body, media_type = entry
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'X-Cache': cache_status}
+        if _etag_matches(if_none_match, etag):
+            self.cache.record_not_modified()
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type=media_type, headers=headers)
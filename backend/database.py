@@ -1,11 +1,21 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 import os
+import logging
+import re
+import threading
+import time
 from dotenv import load_dotenv
+from diagnostics import PlanRecorder
+from metrics import current_route, sql_errors, sql_rows, sql_slow_statements, sql_statement_duration
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 POSTGRES_HOST = os.getenv('POSTGRES_HOST', 'localhost')
 POSTGRES_PORT = os.getenv('POSTGRES_PORT', '5432')
 POSTGRES_DB = os.getenv('POSTGRES_DB', 'marketing_analytics')
@@ -14,13 +24,152 @@ POSTGRES_PASSWORD = os.getenv('POSTGRES_PASSWORD', 'postgres')
 
 DATABASE_URL = f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
 
-engine = create_engine(DATABASE_URL)
+# Connection pool sizing; size the pool against the API's worker thread count
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+DB_POOL_WARMUP = int(os.getenv('DB_POOL_WARMUP', str(DB_POOL_SIZE)))
+DB_POOL_SLOW_CHECKOUT_MS = float(os.getenv('DB_POOL_SLOW_CHECKOUT_MS', '100'))
+DB_SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', '200'))
+# Plans of SELECTs slower than PLAN_CAPTURE_MS are captured in the background
+# (see diagnostics.py); 0 turns this off.
+PLAN_CAPTURE_MS = float(os.getenv('PLAN_CAPTURE_MS', '0'))
+
+class PoolStats:
+    """Cumulative time spent waiting for a pooled connection, including new connects."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, wait):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            avg_wait = self.total_wait / self.checkouts if self.checkouts else 0.0
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(avg_wait * 1000, 3),
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+            }
+
+pool_stats = PoolStats()
+
+class TimedQueuePool(QueuePool):
+    # _do_get is where QueuePool blocks for a free slot or opens a new
+    # connection, so timing it captures both queueing and connect cost.
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.record_timeout()
+            logger.warning(f"Connection pool exhausted: {pool_status()}")
+            raise
+        wait = time.perf_counter() - started
+        pool_stats.record(wait)
+        if wait * 1000 > DB_POOL_SLOW_CHECKOUT_MS:
+            logger.warning(f"Slow connection checkout ({wait * 1000:.1f} ms): {pool_status()}")
+        return record
+
+engine = create_engine(
+    DATABASE_URL,
+    poolclass=TimedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+plan_recorder = PlanRecorder(
+    engine,
+    buffer_ratio=float(os.getenv('PLAN_BUFFER_RATIO', '2')),
+    min_blocks=int(os.getenv('PLAN_BUFFER_MIN_BLOCKS', '100')),
+    timeout_ms=float(os.getenv('PLAN_CAPTURE_TIMEOUT_MS', '60000')),
+)
+# Every statement is timed and attributed to the API route that ran it (see
+# metrics.py); statements slower than DB_SLOW_QUERY_MS are also logged. For
+# ordinary cursors the time includes fetching the result, and rowcount is the
+# number of rows returned. Server-side cursors report no rows here.
+SQL_OPERATIONS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH'}
+
+def _operation(statement):
+    words = statement.split(None, 1)
+    keyword = words[0].upper() if words else ''
+    return keyword if keyword in SQL_OPERATIONS else 'OTHER'
+
+@event.listens_for(engine, 'before_cursor_execute')
+def _start_statement(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('statement_started', []).append(time.perf_counter())
+
+@event.listens_for(engine, 'after_cursor_execute')
+def _finish_statement(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['statement_started'].pop()
+    route = current_route.get()
+    operation = _operation(statement)
+    sql_statement_duration.observe(elapsed, route, operation)
+    sql_rows.inc(route, operation, amount=max(cursor.rowcount, 0))
+    if elapsed * 1000 > DB_SLOW_QUERY_MS:
+        sql_slow_statements.inc(route)
+        logged = ' '.join(re.sub(r'--[^\n]*', '', statement).split())
+        logger.warning(f"Slow statement ({elapsed * 1000:.1f} ms, {route}): {logged[:500]}")
+    # Streamed results (exports) are left out, as explaining them reads the
+    # whole table, and so are the plan recorder's own statements.
+    options = context.execution_options
+    if (PLAN_CAPTURE_MS and elapsed * 1000 > PLAN_CAPTURE_MS and operation in ('SELECT', 'WITH')
+            and not executemany and not options.get('stream_results') and options.get('capture_plans', True)):
+        plan_recorder.submit(statement, parameters, route)
+
+@event.listens_for(engine, 'handle_error')
+def _failed_statement(context):
+    if context.connection is not None and context.connection.info.get('statement_started'):
+        context.connection.info['statement_started'].pop()
+    sql_errors.inc(current_route.get())
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+def pool_status():
+    pool = engine.pool
+    return {
+        "pool_size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        **pool_stats.snapshot(),
+    }
+
+def warm_pool(connections=DB_POOL_WARMUP):
+    # Hold the connections simultaneously so each one is a distinct new
+    # connection; closing returns them to the pool as idle, ready for the
+    # first burst of requests.
+    opened = []
+    try:
+        for _ in range(min(connections, DB_POOL_SIZE)):
+            opened.append(engine.connect())
+    finally:
+        for conn in opened:
+            conn.close()
+    return len(opened)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
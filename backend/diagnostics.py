@@ -0,0 +1,334 @@
+"""Query plan capture and plan regression tracking.
+
+A capture runs EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) on a statement and
+stores the plan in query_plans, with the statement's fingerprint and the data
+version it ran against. Each capture is compared with the previous capture of
+the same query. It is flagged when the plan's shape changes, or when the
+number of buffers it touched changes by more than `buffer_ratio`. The shape
+is the tree of node types, strategies, relations and indexes, without costs,
+row counts or timings.
+
+Named queries (the API's endpoint queries and the showcase queries in
+scripts/04_sql_queries.sql) are captured on demand. database.py also submits
+every SELECT slower than PLAN_CAPTURE_MS, which is captured in the background
+at most once per statement and data version.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+
+from cache import DATA_VERSION_QUERY
+
+logger = logging.getLogger(__name__)
+
+PLANS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS query_plans (
+        id BIGSERIAL PRIMARY KEY,
+        query_name VARCHAR(200) NOT NULL,
+        fingerprint CHAR(16) NOT NULL,
+        plan_shape CHAR(16) NOT NULL,
+        data_version TEXT,
+        trigger VARCHAR(20) NOT NULL,
+        route TEXT,
+        execution_ms DOUBLE PRECISION NOT NULL,
+        planning_ms DOUBLE PRECISION NOT NULL,
+        shared_hit_blocks BIGINT NOT NULL,
+        shared_read_blocks BIGINT NOT NULL,
+        temp_blocks BIGINT NOT NULL,
+        shape_changed BOOLEAN NOT NULL,
+        buffers_changed BOOLEAN NOT NULL,
+        previous_id BIGINT,
+        statement TEXT NOT NULL,
+        plan JSONB NOT NULL,
+        captured_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    CREATE INDEX IF NOT EXISTS query_plans_name_idx ON query_plans (query_name, id DESC);
+"""
+
+PLAN_SUMMARY_COLUMNS = """
+    id, query_name, fingerprint, plan_shape, data_version, trigger, route, execution_ms, planning_ms,
+    shared_hit_blocks, shared_read_blocks, temp_blocks, shape_changed, buffers_changed, previous_id, captured_at
+"""
+
+PREVIOUS_PLAN_QUERY = text(f"""
+    SELECT {PLAN_SUMMARY_COLUMNS}, plan
+    FROM query_plans
+    WHERE query_name = :query_name
+    ORDER BY id DESC
+    LIMIT 1
+""")
+
+INSERT_PLAN_QUERY = text("""
+    INSERT INTO query_plans (
+        query_name, fingerprint, plan_shape, data_version, trigger, route, execution_ms, planning_ms,
+        shared_hit_blocks, shared_read_blocks, temp_blocks, shape_changed, buffers_changed, previous_id,
+        statement, plan
+    ) VALUES (
+        :query_name, :fingerprint, :plan_shape, :data_version, :trigger, :route, :execution_ms, :planning_ms,
+        :shared_hit_blocks, :shared_read_blocks, :temp_blocks, :shape_changed, :buffers_changed, :previous_id,
+        :statement, CAST(:plan AS jsonb)
+    )
+    RETURNING id, captured_at
+""")
+
+# Plan node fields that make up its shape
+SHAPE_KEYS = (
+    'Node Type', 'Strategy', 'Partial Mode', 'Join Type', 'Parent Relationship', 'Scan Direction',
+    'Relation Name', 'Index Name', 'CTE Name', 'Subplan Name',
+)
+
+
+def normalize_sql(statement):
+    """The statement without comments, on one line."""
+    return ' '.join(re.sub(r'--[^\n]*', '', statement).split())
+
+
+def fingerprint(statement):
+    return hashlib.sha256(normalize_sql(statement).encode()).hexdigest()[:16]
+
+
+def plan_shape(node):
+    children = [plan_shape(child) for child in node.get('Plans', [])]
+    # Parallel appends order their partitions by cost, which is not part of the shape
+    if node['Node Type'] in ('Append', 'Merge Append'):
+        children.sort(key=json.dumps)
+    return [{key: node[key] for key in SHAPE_KEYS if key in node}, children]
+
+
+def shape_hash(node):
+    return hashlib.sha256(json.dumps(plan_shape(node), sort_keys=True).encode()).hexdigest()[:16]
+
+
+def describe_shape(node, depth=0):
+    """One indented line per plan node, e.g. 'Index Scan on marketing_campaigns_2013 using ...'."""
+    label = node['Node Type']
+    if node.get('Strategy') not in (None, 'Plain'):
+        label = f"{node['Strategy']} {label}"
+    if node.get('Partial Mode') not in (None, 'Simple'):
+        label = f"{node['Partial Mode']} {label}"
+    if 'Join Type' in node:
+        label += f" ({node['Join Type']})"
+    if 'Relation Name' in node:
+        label += f" on {node['Relation Name']}"
+    if 'Index Name' in node:
+        label += f" using {node['Index Name']}"
+    if 'Subplan Name' in node:
+        label += f" [{node['Subplan Name']}]"
+    lines = ['  ' * depth + label]
+    for child in node.get('Plans', []):
+        lines.extend(describe_shape(child, depth + 1))
+    return lines
+
+
+def buffer_counts(node):
+    # A node's buffer counts include those of the nodes below it
+    return {
+        'shared_hit_blocks': node.get('Shared Hit Blocks', 0),
+        'shared_read_blocks': node.get('Shared Read Blocks', 0),
+        'temp_blocks': node.get('Temp Read Blocks', 0) + node.get('Temp Written Blocks', 0),
+    }
+
+
+def total_blocks(counts):
+    return counts['shared_hit_blocks'] + counts['shared_read_blocks'] + counts['temp_blocks']
+
+
+def read_named_queries(path, prefix):
+    """The statements of a SQL file, each named after the last comment line above it."""
+    with open(path) as f:
+        chunks = f.read().split(';')
+    queries = {}
+    for chunk in chunks:
+        lines = [line.strip() for line in chunk.splitlines()]
+        titles = [line.strip('- ') for line in lines if line.startswith('--') and line.strip('-= ')]
+        statement = '\n'.join(line for line in lines if line and not line.startswith('--'))
+        if not statement:
+            continue
+        slug = re.sub(r'[^a-z0-9]+', '_', titles[-1].lower()).strip('_') if titles else 'query'
+        name = f"{prefix}.{slug}"
+        while name in queries:
+            name += '_'
+        queries[name] = statement
+    return queries
+
+
+class PlanRecorder:
+    """Captures, stores and compares the plans of named and slow statements."""
+
+    def __init__(self, engine, buffer_ratio=2.0, min_blocks=100, timeout_ms=60000):
+        # Statements of the recorder's own are never captured as slow statements
+        self.engine = engine.execution_options(capture_plans=False)
+        self.buffer_ratio = buffer_ratio
+        self.min_blocks = min_blocks
+        self.timeout_ms = timeout_ms
+        self._queries = {}  # name -> (DBAPI statement, parameters)
+        self._names = {}  # fingerprint -> name
+        self._pending = set()
+        self._captured = set()  # fingerprints captured automatically at _captured_version
+        self._captured_version = None
+        self._table_ready = False
+        self._lock = threading.Lock()
+        # One capture at a time; EXPLAIN ANALYZE runs the statement again
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='plan-capture')
+
+    def register(self, name, query, parameters=None):
+        """Add a named query: SQL text, or a text() construct and its bound parameters."""
+        if hasattr(query, 'compile'):
+            # The statement as the driver receives it, so slow statements match it by fingerprint
+            query = str(query.compile(dialect=self.engine.dialect))
+            parameters = parameters or {}
+        self._queries[name] = (query, parameters)
+        self._names[fingerprint(query)] = name
+
+    def named_queries(self):
+        return list(self._queries)
+
+    def _ensure_table(self):
+        with self._lock:
+            if not self._table_ready:
+                with self.engine.begin() as conn:
+                    conn.exec_driver_sql(PLANS_TABLE_SQL)
+                self._table_ready = True
+
+    def _data_version(self, conn):
+        if conn.exec_driver_sql("SELECT to_regclass('pipeline_metadata')").scalar() is None:
+            return None
+        return conn.execute(DATA_VERSION_QUERY).scalar()
+
+    def _explain(self, statement, parameters):
+        explain = f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}"
+        with self.engine.connect() as conn:
+            # EXPLAIN ANALYZE executes the statement; its transaction is rolled back
+            with conn.begin() as transaction:
+                conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(self.timeout_ms)}")
+                version = self._data_version(conn)
+                if parameters is None:
+                    document = conn.exec_driver_sql(explain).scalar()
+                else:
+                    document = conn.exec_driver_sql(explain, parameters).scalar()
+                transaction.rollback()
+        if isinstance(document, str):
+            document = json.loads(document)
+        return document[0], version
+
+    def _compare(self, counts, plan, previous):
+        if previous is None:
+            return False, False
+        shape_changed = shape_hash(plan) != previous['plan_shape'].strip()
+        before, after = total_blocks(previous), total_blocks(counts)
+        low, high = sorted((before, after))
+        buffers_changed = high - low >= self.min_blocks and high >= self.buffer_ratio * max(low, 1)
+        return shape_changed, buffers_changed
+
+    def capture(self, name, statement, parameters=None, trigger='on_demand', route=None):
+        """Explain one statement, store its plan and compare it with the previous one of `name`."""
+        self._ensure_table()
+        document, version = self._explain(statement, parameters)
+        plan = document['Plan']
+        counts = buffer_counts(plan)
+        record = {
+            'query_name': name,
+            'fingerprint': fingerprint(statement),
+            'plan_shape': shape_hash(plan),
+            'data_version': version,
+            'trigger': trigger,
+            'route': route,
+            'execution_ms': document['Execution Time'],
+            'planning_ms': document['Planning Time'],
+            **counts,
+        }
+        with self.engine.begin() as conn:
+            previous = conn.execute(PREVIOUS_PLAN_QUERY, {'query_name': name}).mappings().first()
+            shape_changed, buffers_changed = self._compare(counts, plan, previous)
+            record.update(shape_changed=shape_changed, buffers_changed=buffers_changed,
+                          previous_id=previous['id'] if previous else None)
+            inserted = conn.execute(INSERT_PLAN_QUERY, {
+                **record, 'statement': normalize_sql(statement), 'plan': json.dumps(document),
+            }).one()
+        record.update(id=inserted.id, captured_at=inserted.captured_at, shape=describe_shape(plan))
+        if previous is not None:
+            record['previous'] = {key: previous[key] for key in (
+                'id', 'data_version', 'plan_shape', 'execution_ms', 'shared_hit_blocks', 'shared_read_blocks',
+                'temp_blocks', 'captured_at')}
+            if shape_changed:
+                record['previous']['shape'] = describe_shape(previous['plan']['Plan'])
+        if shape_changed or buffers_changed:
+            logger.warning(
+                f"Plan regression in {name}: shape {'changed' if shape_changed else 'unchanged'}, "
+                f"{total_blocks(previous)} -> {total_blocks(counts)} buffers "
+                f"(data version {previous['data_version']} -> {version})"
+            )
+        return record
+
+    def capture_named(self, names=None):
+        """Capture every named query, or those in `names`; a query that fails is reported with its error."""
+        results = []
+        for name in names or self._queries:
+            statement, parameters = self._queries[name]
+            try:
+                results.append(self.capture(name, statement, parameters))
+            except Exception as e:
+                error = str(e).split('\n')[0]
+                logger.warning(f"Plan capture of {name} failed: {error}")
+                results.append({'query_name': name, 'error': error})
+        return results
+
+    def submit(self, statement, parameters, route):
+        """Queue a background capture of a slow statement."""
+        key = fingerprint(statement)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        parameters = dict(parameters) if isinstance(parameters, dict) else parameters
+        self._executor.submit(self._capture_slow, key, statement, parameters, route)
+
+    def _capture_slow(self, key, statement, parameters, route):
+        try:
+            with self.engine.connect() as conn:
+                version = self._data_version(conn)
+            with self._lock:
+                # Slow statements are captured again once the data changes
+                if version != self._captured_version:
+                    self._captured.clear()
+                    self._captured_version = version
+                if key in self._captured:
+                    return
+                self._captured.add(key)
+            self.capture(self._names.get(key, f"{route} {key[:8]}"), statement, parameters,
+                         trigger='slow', route=route)
+        except Exception as e:
+            logger.warning(f"Plan capture of slow statement {key} failed: {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def history(self, name=None, flagged=False, limit=50):
+        """Stored captures without their plans, newest first."""
+        self._ensure_table()
+        conditions = []
+        if name is not None:
+            conditions.append("query_name = :query_name")
+        if flagged:
+            conditions.append("(shape_changed OR buffers_changed)")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        query = text(f"SELECT {PLAN_SUMMARY_COLUMNS} FROM query_plans {where} ORDER BY id DESC LIMIT :limit")
+        with self.engine.connect() as conn:
+            return [dict(row) for row in conn.execute(query, {'query_name': name, 'limit': limit}).mappings()]
+
+    def plan(self, plan_id):
+        """One stored capture with its statement and full plan, or None."""
+        self._ensure_table()
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                text(f"SELECT {PLAN_SUMMARY_COLUMNS}, statement, plan FROM query_plans WHERE id = :id"),
+                {'id': plan_id},
+            ).mappings().first()
+        if row is None:
+            return None
+        return {**row, 'shape': describe_shape(row['plan']['Plan'])}
@@ -0,0 +1,206 @@
+"""Request and SQL metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms are kept in process, per label set, behind a
+lock; `render()` writes them all for GET /api/metrics. MetricsMiddleware
+records per-route request latency, status codes and in-flight requests, and
+sets `current_route` so that the SQL statement hooks in database.py can
+attribute each statement to the route that ran it. Routes are labelled by
+their path template, not the raw path, to keep the number of series fixed.
+"""
+import contextvars
+import threading
+import time
+
+from starlette.routing import Match
+
+# Seconds; covers cached responses (sub-millisecond) to full exports
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Route of the request being served; copied into worker threads with the context
+current_route = contextvars.ContextVar('current_route', default='none')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.label_names, labels)} {_number(value)}"
+                                for labels, value in values]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        with self._lock:
+            values = sorted((labels, (list(counts), total, count)) for labels, (counts, total, count)
+                            in self._values.items())
+        lines = self.header()
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, [('le', _number(bound))])} "
+                             f"{cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class Registry:
+    """Metrics in registration order, plus collectors that report current values when rendered."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        """`collect()` returns (name, help, kind, value) tuples read at render time."""
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for name, help, kind, value in collect():
+                lines.extend([f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {_number(value)}"])
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_requests_in_flight = registry.register(Gauge(
+    'http_requests_in_flight', 'Requests being served', ['route']))
+http_requests = registry.register(Counter(
+    'http_requests_total', 'Requests served, by status code', ['method', 'route', 'status']))
+http_request_duration = registry.register(Histogram(
+    'http_request_duration_seconds', 'Time from receiving a request to sending its last byte',
+    ['method', 'route']))
+sql_statement_duration = registry.register(Histogram(
+    'sql_statement_duration_seconds', 'Execution time of SQL statements, by the route that ran them',
+    ['route', 'operation']))
+sql_rows = registry.register(Counter(
+    'sql_rows_returned_total', 'Rows returned or affected by SQL statements', ['route', 'operation']))
+sql_errors = registry.register(Counter(
+    'sql_errors_total', 'SQL statements that raised an error', ['route']))
+sql_slow_statements = registry.register(Counter(
+    'sql_slow_statements_total', 'SQL statements slower than DB_SLOW_QUERY_MS', ['route']))
+
+
+def route_label(routes, scope):
+    """Path template of the route matching `scope`, e.g. /api/kpis."""
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, 'path', scope['path'])
+    return 'unmatched'
+
+
+class MetricsMiddleware:
+    """Outermost ASGI middleware: timing includes cached responses and streamed bodies."""
+
+    # Matching walks every route, so the labels of recent paths are kept
+    MAX_CACHED_PATHS = 1024
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes
+        self._labels = {}
+
+    def _route(self, scope):
+        key = (scope['method'], scope['path'])
+        route = self._labels.get(key)
+        if route is None:
+            route = route_label(self.routes, scope)
+            if len(self._labels) >= self.MAX_CACHED_PATHS:
+                self._labels.clear()
+            self._labels[key] = route
+        return route
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        route = self._route(scope)
+        token = current_route.set(route)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        http_requests_in_flight.inc(route)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_request_duration.observe(time.perf_counter() - started, scope['method'], route)
+            http_requests.inc(scope['method'], route, str(status))
+            http_requests_in_flight.dec(route)
+            current_route.reset(token)
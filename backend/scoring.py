@@ -0,0 +1,124 @@
+import logging
+import os
+import sys
+import threading
+from datetime import date
+
+import numpy as np
+from sqlalchemy import text
+
+# The model artifact and feature definitions are owned by the pipeline scripts
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts')
+if SCRIPTS_DIR not in sys.path:
+    sys.path.append(SCRIPTS_DIR)
+
+from features import (AGE_BINS, AGE_LABELS, INCOME_BINS, INCOME_LABELS, age, bucket, clv,  # noqa: E402
+                      reference_date, tenure_days)
+from segmentation import LATEST_MODEL, MODEL_DIR, assign_segment, load_model, segment_labels  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# Stamped by 03_load_to_postgres.py with the data version
+REFERENCE_DATE_QUERY = text("SELECT value FROM pipeline_metadata WHERE key = 'reference_date'")
+
+SPENDING_FIELDS = ['mnt_wines', 'mnt_fruits', 'mnt_meat_products', 'mnt_fish_products',
+                   'mnt_sweet_products', 'mnt_gold_prods']
+PURCHASE_FIELDS = ['num_web_purchases', 'num_catalog_purchases', 'num_store_purchases']
+
+
+class SegmentScorer:
+    """Scores batches of customers against the latest saved segmentation model.
+
+    The model file is re-read when its modification time changes, so a refit
+    by 01_data_cleaning.py is picked up without restarting the API. With an
+    engine, new customers are scored as of the same date as the loaded ones;
+    that date is re-read when `data_version()` changes.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, engine=None, data_version=None):
+        self.path = os.path.join(model_dir, LATEST_MODEL)
+        self.engine = engine
+        self.data_version = data_version
+        self._model = None
+        self._mtime = None
+        self._as_of = None
+        self._as_of_version = None
+        self._lock = threading.Lock()
+
+    def model(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return None
+        with self._lock:
+            if mtime != self._mtime:
+                # Raises on an unreadable file; _mtime stays put so the next call retries
+                self._model = load_model(path=self.path)
+                self._mtime = mtime
+                if self._model is not None:
+                    logger.info(f"Loaded segmentation model {self._model['version']}")
+            return self._model
+
+    def data_reference_date(self):
+        """Date the loaded customers' features were computed as of; None if
+        there is no engine or the load did not record one."""
+        if self.engine is None:
+            return None
+        version = self.data_version() if self.data_version else None
+        with self._lock:
+            if version is not None and version == self._as_of_version:
+                return self._as_of
+        try:
+            with self.engine.connect() as conn:
+                value = conn.execute(REFERENCE_DATE_QUERY).scalar()
+        except Exception as e:
+            logger.warning(f"Reference date of the loaded data unavailable: {e}")
+            return None
+        with self._lock:
+            self._as_of = date.fromisoformat(value) if value else None
+            self._as_of_version = version
+        return self._as_of
+
+    def score(self, customers, model, as_of=None):
+        """Segment, CLV and age/income groups for objects with the customer feature fields.
+
+        Ages and tenure are computed as of `as_of`, else the loaded data's
+        reference date, else $FEATURE_REFERENCE_DATE or today.
+        """
+        as_of = reference_date(as_of or self.data_reference_date())
+
+        def column(field, dtype='float64'):
+            return np.fromiter((getattr(c, field) for c in customers), dtype=dtype, count=len(customers))
+
+        year_birth = column('year_birth')
+        recency = column('recency')
+        income = np.array([c.income for c in customers], dtype='float64')
+        if model.get('income_median') is not None:
+            income = np.where(np.isnan(income), model['income_median'], income)
+        total_spent = sum(column(field) for field in SPENDING_FIELDS)
+        total_purchases = sum(column(field) for field in PURCHASE_FIELDS)
+        joined = np.array([c.dt_customer for c in customers], dtype='datetime64[D]')
+
+        ages = age(year_birth, as_of)
+        values = clv(total_spent, tenure_days(joined, as_of))
+        segments = assign_segment(np.column_stack([recency, total_purchases, total_spent]), model)
+        labels = segment_labels(segments, model)
+        age_groups = bucket(ages, AGE_BINS, AGE_LABELS)
+        income_groups = bucket(income, INCOME_BINS, INCOME_LABELS)
+
+        clv_out = np.round(values, 2).astype(object)
+        clv_out[np.isnan(values)] = None
+        return [
+            {
+                "id": c.id,
+                "segment": int(segment),
+                "segment_label": label,
+                "clv": value,
+                "total_spent": float(spent),
+                "age": int(a),
+                "age_group": age_group,
+                "income_group": income_group,
+            }
+            for c, segment, label, value, spent, a, age_group, income_group in zip(
+                customers, segments, labels, clv_out, total_spent, ages, age_groups, income_groups)
+        ]
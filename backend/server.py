@@ -1,18 +1,62 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy import text
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
+import anyio
+import base64
+import json
 import os
 import logging
+import threading
+import time
 from dotenv import load_dotenv
-from pydantic import BaseModel
-from typing import List, Dict, Any
-from database import get_db, engine
+from pydantic import BaseModel, ConfigDict, ValidationError
+from typing import List, Dict, Any, Optional
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+from database import get_db, engine, warm_pool, pool_status, plan_recorder, SessionLocal, DB_POOL_SIZE, DB_MAX_OVERFLOW
+from cache import ResponseCache, ResponseCacheMiddleware
+from scoring import SegmentScorer
+from snapshot import SnapshotStore
+from export import EXPORT_ENCODERS, ExportStream
+from metrics import MetricsMiddleware, registry
+from diagnostics import read_named_queries
 
 load_dotenv()
 
 app = FastAPI(title="Marketing Analytics API")
 
+# Aggregate responses only change when the loader stamps a new data version,
+# so they are cached in-process and revalidated with ETags. Registered before
+# CORS so cached and 304 responses still carry the CORS headers.
+CACHEABLE_PATHS = [
+    '/api/kpis',
+    '/api/segments',
+    '/api/campaigns',
+    '/api/products',
+    '/api/channels',
+    '/api/demographics',
+    '/api/insights',
+    '/api/dashboard',
+    '/api/cohorts',
+]
+response_cache = ResponseCache(
+    engine,
+    version_ttl=float(os.getenv('CACHE_VERSION_TTL', '5')),
+    max_entries=int(os.getenv('CACHE_MAX_ENTRIES', '1024')),
+)
+app.add_middleware(ResponseCacheMiddleware, cache=response_cache, paths=CACHEABLE_PATHS)
+
+# SERVING_ENGINE=snapshot answers the aggregate and cohort endpoints from an
+# in-memory NumPy copy of marketing_campaigns (see snapshot.py), reloaded in
+# the background whenever the data version changes. The default, postgres,
+# queries the database on every cache miss.
+SERVING_ENGINE = os.getenv('SERVING_ENGINE', 'postgres')
+if SERVING_ENGINE not in ('postgres', 'snapshot'):
+    raise ValueError(f"SERVING_ENGINE must be 'postgres' or 'snapshot', not '{SERVING_ENGINE}'")
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -21,9 +65,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so request timings include cache hits and streamed bodies
+app.add_middleware(MetricsMiddleware, routes=app.router.routes)
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Database handlers are plain `def` functions, so FastAPI runs them in AnyIO's
+# worker thread pool instead of on the event loop. The pool is capped to match
+# the SQLAlchemy connection pool (pool size + overflow) so a burst of
+# dashboard requests queues for a thread rather than for a connection.
+DB_THREADPOOL_SIZE = int(os.getenv('DB_THREADPOOL_SIZE', str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+
+@app.on_event("startup")
+async def configure_threadpool():
+    anyio.to_thread.current_default_thread_limiter().total_tokens = DB_THREADPOOL_SIZE
+    logger.info(f"Database thread pool limited to {DB_THREADPOOL_SIZE} workers")
+
+@app.on_event("startup")
+def load_serving_snapshot():
+    if snapshot_store is None:
+        return
+    try:
+        snapshot_store.load()
+    except Exception as e:
+        logger.warning(f"Snapshot load failed, aggregates are served from Postgres: {e}")
+
+@app.on_event("startup")
+def warm_connection_pool():
+    # Open the pool's connections before the first request instead of on it
+    try:
+        opened = warm_pool()
+        logger.info(f"Connection pool warmed with {opened} connections: {pool_status()}")
+    except Exception as e:
+        logger.warning(f"Connection pool warmup failed: {e}")
+
 # Pydantic models
 class KPIResponse(BaseModel):
     total_customers: int
@@ -53,12 +129,346 @@ class ChannelData(BaseModel):
     purchases: int
     share: float
 
+class DemographicGroup(BaseModel):
+    group: Optional[str]
+    customers: int
+    avg_spending: float
+
+class DemographicsResponse(BaseModel):
+    age_groups: List[DemographicGroup]
+    income_groups: List[DemographicGroup]
+
+class InsightsResponse(BaseModel):
+    total_customers: int
+    avg_age: int
+    avg_income: float
+    total_revenue: float
+    largest_segment: Optional[str]
+    high_spenders: int
+
+class DashboardResponse(BaseModel):
+    kpis: KPIResponse
+    segments: List[SegmentData]
+    campaigns: List[CampaignData]
+    products: List[ProductData]
+    channels: List[ChannelData]
+    demographics: DemographicsResponse
+    insights: InsightsResponse
+
+class CohortData(BaseModel):
+    cohort_month: date
+    customers: int
+    total_revenue: float
+    avg_revenue: float
+    avg_clv: float
+    campaign_acceptances: int
+    acceptances_per_customer: float
+    response_rate: float
+
+class CustomerFeatures(BaseModel):
+    id: Optional[int] = None
+    year_birth: int
+    income: Optional[float] = None
+    dt_customer: date
+    recency: int
+    mnt_wines: float = 0
+    mnt_fruits: float = 0
+    mnt_meat_products: float = 0
+    mnt_fish_products: float = 0
+    mnt_sweet_products: float = 0
+    mnt_gold_prods: float = 0
+    num_web_purchases: int = 0
+    num_catalog_purchases: int = 0
+    num_store_purchases: int = 0
+
+class ScoreRequest(BaseModel):
+    customers: List[CustomerFeatures]
+
+class CustomerScore(BaseModel):
+    id: Optional[int]
+    segment: int
+    segment_label: str
+    clv: Optional[float]
+    total_spent: float
+    age: int
+    age_group: Optional[str]
+    income_group: Optional[str]
+
+class ScoreResponse(BaseModel):
+    model_version: str
+    scores: List[CustomerScore]
+
+class CustomerRecord(BaseModel):
+    id: int
+    age: Optional[int]
+    age_group: Optional[str]
+    education: Optional[str]
+    marital_status: Optional[str]
+    income: Optional[float]
+    income_group: Optional[str]
+    dt_customer: Optional[date]
+    recency: Optional[int]
+    total_spent: Optional[float]
+    total_purchases: Optional[int]
+    total_campaigns_accepted: Optional[int]
+    response: Optional[int]
+    clv: Optional[float]
+    segment: Optional[str]
+
+class CustomerPage(BaseModel):
+    customers: List[CustomerRecord]
+    next_cursor: Optional[str] = None
+
+class BatchItem(BaseModel):
+    endpoint: str
+    params: Dict[str, Any] = {}
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem]
+
+class BatchResult(BaseModel):
+    endpoint: str
+    status: int
+    elapsed_ms: float
+    data: Optional[Any] = None
+    error: Optional[Any] = None
+
+class BatchResponse(BaseModel):
+    elapsed_ms: float
+    results: List[BatchResult]
+
+class NoParams(BaseModel):
+    model_config = ConfigDict(extra='forbid')
+
+class AggregateParams(NoParams):
+    segment: Optional[str] = None
+    age_group: Optional[str] = None
+    income_group: Optional[str] = None
+    education: Optional[str] = None
+    enrolled_from: Optional[date] = None
+    enrolled_to: Optional[date] = None
+
+class CohortParams(NoParams):
+    enrolled_from: Optional[date] = None
+    enrolled_to: Optional[date] = None
+
 @app.get("/api/")
 async def root():
     return {"message": "Marketing Analytics API", "status": "active"}
 
+# Aggregates are served from marketing_summary, a materialized view of
+# sql/marketing_summary.sql that 03_load_to_postgres.py rebuilds in the same
+# transaction as each load. Every endpoint reads a handful of pre-computed rows,
+# so request cost no longer depends on the number of customers. Rows come back
+# in the order each endpoint returns them.
+SUMMARY_ORDER = """
+    ORDER BY
+        level,
+        CASE WHEN level = 'segment' THEN avg_clv END DESC,
+        CASE WHEN level = 'income_group' THEN
+            CASE group_value
+                WHEN 'Low' THEN 1
+                WHEN 'Lower-Mid' THEN 2
+                WHEN 'Mid' THEN 3
+                WHEN 'Upper-Mid' THEN 4
+                WHEN 'High' THEN 5
+            END
+        END,
+        group_value
+"""
+SUMMARY_QUERY = text("SELECT * FROM marketing_summary" + SUMMARY_ORDER)
+
+# Filtered aggregates cannot use the pre-computed rows, so they run the same
+# summary SQL live. A CTE named marketing_campaigns shadows the table with only
+# the matching customers; values are always bound parameters. The loader's
+# composite indexes on the filter columns keep these to index scans.
+SUMMARY_SQL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sql', 'marketing_summary.sql')
+with open(SUMMARY_SQL_PATH) as f:
+    SUMMARY_SQL = f.read().strip().rstrip(';')
+
+AGGREGATE_FILTERS = {
+    'segment': "customer_segment_label = :segment",
+    'age_group': "age_group = :age_group",
+    'income_group': "income_group = :income_group",
+    'education': "education = :education",
+    'enrolled_from': "dt_customer >= :enrolled_from",
+    'enrolled_to': "dt_customer <= :enrolled_to",
+}
+
+def aggregate_filters(
+    segment: Optional[str] = None,
+    age_group: Optional[str] = None,
+    income_group: Optional[str] = None,
+    education: Optional[str] = None,
+    enrolled_from: Optional[date] = None,
+    enrolled_to: Optional[date] = None
+) -> Dict[str, Any]:
+    filters = {
+        'segment': segment,
+        'age_group': age_group,
+        'income_group': income_group,
+        'education': education,
+        'enrolled_from': enrolled_from,
+        'enrolled_to': enrolled_to,
+    }
+    return {name: value for name, value in filters.items() if value is not None}
+
+def _filtered_summary_query(filters):
+    conditions = ' AND '.join(AGGREGATE_FILTERS[name] for name in filters)
+    return text(
+        f"WITH marketing_campaigns AS (SELECT * FROM marketing_campaigns WHERE {conditions})\n"
+        f"SELECT * FROM (\n{SUMMARY_SQL}\n) marketing_summary" + SUMMARY_ORDER
+    )
+
+CAMPAIGN_COLUMNS = [(f'Campaign {n}', f'cmp{n}') for n in range(1, 6)]
+PRODUCT_COLUMNS = [
+    ('Wines', 'wines_revenue'),
+    ('Meat', 'meat_revenue'),
+    ('Fish', 'fish_revenue'),
+    ('Gold', 'gold_revenue'),
+    ('Fruits', 'fruits_revenue'),
+    ('Sweets', 'sweets_revenue'),
+]
+CHANNEL_COLUMNS = [
+    ('Store', 'store_purchases'),
+    ('Web', 'web_purchases'),
+    ('Catalog', 'catalog_purchases'),
+]
+
+def _share(part, total):
+    # Matches ROUND(part * 100.0 / total, 2) on Postgres numerics
+    if part is None or not total:
+        return 0.0
+    return float((Decimal(part) * 100 / Decimal(total)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+
+def _fetch_summary(db: Session, filters: Optional[Dict[str, Any]] = None):
+    snapshot = snapshot_store.current() if snapshot_store else None
+    if snapshot is not None:
+        return snapshot.summary(filters)
+    summary = {'overall': None, 'segment': [], 'age_group': [], 'income_group': []}
+    query = _filtered_summary_query(filters) if filters else SUMMARY_QUERY
+    for row in db.execute(query, filters or {}).mappings():
+        if row['level'] == 'overall':
+            summary['overall'] = row
+        else:
+            summary[row['level']].append(row)
+    return summary
+
+def _kpis_payload(overall):
+    return {
+        "total_customers": overall['customers'],
+        "total_revenue": float(overall['total_revenue'] or 0),
+        "avg_customer_spend": float(overall['avg_spending'] or 0),
+        "avg_clv": float(overall['avg_clv'] or 0),
+        "response_rate": float(overall['response_rate'] or 0)
+    }
+
+def _segments_payload(segment_rows):
+    return [
+        {
+            "segment": row['group_value'],
+            "count": row['customers'],
+            "avg_spending": float(row['avg_spending'] or 0),
+            "avg_clv": float(row['avg_clv'] or 0)
+        }
+        for row in segment_rows
+    ]
+
+def _campaigns_payload(overall):
+    campaigns = [
+        {
+            "campaign": name,
+            "acceptances": overall[f'{column}_acceptances'] or 0,
+            "rate": float(overall[f'{column}_rate'] or 0)
+        }
+        for name, column in CAMPAIGN_COLUMNS
+    ]
+    return sorted(campaigns, key=lambda item: item['rate'], reverse=True)
+
+def _products_payload(overall):
+    total = sum(overall[column] or 0 for _, column in PRODUCT_COLUMNS)
+    products = [
+        {
+            "category": name,
+            "revenue": float(overall[column] or 0),
+            "share": _share(overall[column], total)
+        }
+        for name, column in PRODUCT_COLUMNS
+    ]
+    return sorted(products, key=lambda item: item['revenue'], reverse=True)
+
+def _channels_payload(overall):
+    total = sum(overall[column] or 0 for _, column in CHANNEL_COLUMNS)
+    channels = [
+        {
+            "channel": name,
+            "purchases": overall[column] or 0,
+            "share": _share(overall[column], total)
+        }
+        for name, column in CHANNEL_COLUMNS
+    ]
+    return sorted(channels, key=lambda item: item['purchases'], reverse=True)
+
+def _demographics_payload(age_rows, income_rows):
+    return {
+        "age_groups": [
+            {"group": row['group_value'], "customers": row['customers'], "avg_spending": float(row['avg_spending'] or 0)}
+            for row in age_rows
+        ],
+        "income_groups": [
+            {"group": row['group_value'], "customers": row['customers'], "avg_spending": float(row['avg_spending'] or 0)}
+            for row in income_rows
+        ]
+    }
+
+def _insights_payload(overall, segment_rows):
+    largest = max(segment_rows, key=lambda row: row['customers'], default=None)
+    return {
+        "total_customers": overall['customers'],
+        "avg_age": int(overall['avg_age'] or 0),
+        "avg_income": float(overall['avg_income'] or 0),
+        "total_revenue": float(overall['total_revenue'] or 0),
+        "largest_segment": largest['group_value'] if largest else None,
+        "high_spenders": overall['high_spenders']
+    }
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return response_cache.stats()
+
+@app.get("/api/snapshot")
+async def snapshot_stats():
+    return snapshot_store.stats() if snapshot_store else {"engine": "postgres"}
+
+def _pool_and_cache_metrics():
+    pool = pool_status()
+    cache = response_cache.stats()
+    return [
+        ('db_pool_checked_out', 'Connections in use', 'gauge', pool['checked_out']),
+        ('db_pool_idle', 'Connections idle in the pool', 'gauge', pool['idle']),
+        ('db_pool_overflow', 'Connections open beyond the pool size', 'gauge', pool['overflow']),
+        ('db_pool_checkouts_total', 'Connection checkouts', 'counter', pool['checkouts']),
+        ('db_pool_timeouts_total', 'Checkouts that timed out', 'counter', pool['timeouts']),
+        ('db_pool_max_wait_seconds', 'Longest checkout wait', 'gauge', pool['max_wait_ms'] / 1000),
+        ('response_cache_entries', 'Cached responses', 'gauge', cache['entries']),
+        ('response_cache_hits_total', 'Response cache hits', 'counter', cache['hits']),
+        ('response_cache_misses_total', 'Response cache misses', 'counter', cache['misses']),
+        ('response_cache_not_modified_total', '304 responses', 'counter', cache['not_modified']),
+    ]
+
+registry.add_collector(_pool_and_cache_metrics)
+
+@app.get("/api/metrics")
+async def get_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4')
+
+@app.get("/api/pool")
+async def get_pool_status():
+    return pool_status()
+
 @app.get("/api/health")
-async def health_check(db: Session = Depends(get_db)):
+def health_check(db: Session = Depends(get_db)):
     try:
         db.execute(text("SELECT 1"))
         return {"status": "healthy", "database": "connected"}
@@ -67,232 +477,419 @@ async def health_check(db: Session = Depends(get_db)):
         raise HTTPException(status_code=503, detail="Database connection failed")
 
 @app.get("/api/kpis", response_model=KPIResponse)
-async def get_kpis(db: Session = Depends(get_db)):
+def get_kpis(filters: Dict[str, Any] = Depends(aggregate_filters), db: Session = Depends(get_db)):
     try:
-        query = text("""
-            SELECT 
-                COUNT(*) as total_customers,
-                ROUND(SUM(total_spent), 2) as total_revenue,
-                ROUND(AVG(total_spent), 2) as avg_customer_spend,
-                ROUND(AVG(clv), 2) as avg_clv,
-                ROUND(AVG(CASE WHEN total_campaigns_accepted > 0 THEN 1 ELSE 0 END) * 100, 2) as response_rate
-            FROM marketing_campaigns
-        """)
-        result = db.execute(query).fetchone()
-        return {
-            "total_customers": result[0],
-            "total_revenue": float(result[1] or 0),
-            "avg_customer_spend": float(result[2] or 0),
-            "avg_clv": float(result[3] or 0),
-            "response_rate": float(result[4] or 0)
-        }
+        return _kpis_payload(_fetch_summary(db, filters)['overall'])
     except Exception as e:
         logger.error(f"Error fetching KPIs: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/segments", response_model=List[SegmentData])
-async def get_segments(db: Session = Depends(get_db)):
+def get_segments(db: Session = Depends(get_db)):
     try:
-        query = text("""
-            SELECT 
-                customer_segment_label as segment,
-                COUNT(*) as count,
-                ROUND(AVG(total_spent), 2) as avg_spending,
-                ROUND(AVG(clv), 2) as avg_clv
-            FROM marketing_campaigns
-            GROUP BY customer_segment_label
-            ORDER BY avg_clv DESC
-        """)
-        results = db.execute(query).fetchall()
-        return [
-            {
-                "segment": row[0],
-                "count": row[1],
-                "avg_spending": float(row[2] or 0),
-                "avg_clv": float(row[3] or 0)
-            }
-            for row in results
-        ]
+        return _segments_payload(_fetch_summary(db)['segment'])
     except Exception as e:
         logger.error(f"Error fetching segments: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/campaigns", response_model=List[CampaignData])
-async def get_campaigns(db: Session = Depends(get_db)):
+def get_campaigns(filters: Dict[str, Any] = Depends(aggregate_filters), db: Session = Depends(get_db)):
     try:
-        query = text("""
-            SELECT 'Campaign 1' as campaign, SUM(accepted_cmp1) as acceptances, 
-                   ROUND(AVG(accepted_cmp1) * 100, 2) as rate
-            FROM marketing_campaigns
-            UNION ALL
-            SELECT 'Campaign 2', SUM(accepted_cmp2), ROUND(AVG(accepted_cmp2) * 100, 2)
-            FROM marketing_campaigns
-            UNION ALL
-            SELECT 'Campaign 3', SUM(accepted_cmp3), ROUND(AVG(accepted_cmp3) * 100, 2)
-            FROM marketing_campaigns
-            UNION ALL
-            SELECT 'Campaign 4', SUM(accepted_cmp4), ROUND(AVG(accepted_cmp4) * 100, 2)
-            FROM marketing_campaigns
-            UNION ALL
-            SELECT 'Campaign 5', SUM(accepted_cmp5), ROUND(AVG(accepted_cmp5) * 100, 2)
-            FROM marketing_campaigns
-            ORDER BY rate DESC
-        """)
-        results = db.execute(query).fetchall()
-        return [
-            {
-                "campaign": row[0],
-                "acceptances": row[1],
-                "rate": float(row[2] or 0)
-            }
-            for row in results
-        ]
+        return _campaigns_payload(_fetch_summary(db, filters)['overall'])
     except Exception as e:
         logger.error(f"Error fetching campaigns: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/products", response_model=List[ProductData])
-async def get_products(db: Session = Depends(get_db)):
+def get_products(filters: Dict[str, Any] = Depends(aggregate_filters), db: Session = Depends(get_db)):
     try:
-        query = text("""
-            WITH product_revenue AS (
-                SELECT 
-                    'Wines' as category,
-                    SUM(mnt_wines) as revenue
-                FROM marketing_campaigns
-                UNION ALL
-                SELECT 'Meat', SUM(mnt_meat_products) FROM marketing_campaigns
-                UNION ALL
-                SELECT 'Fish', SUM(mnt_fish_products) FROM marketing_campaigns
-                UNION ALL
-                SELECT 'Gold', SUM(mnt_gold_prods) FROM marketing_campaigns
-                UNION ALL
-                SELECT 'Fruits', SUM(mnt_fruits) FROM marketing_campaigns
-                UNION ALL
-                SELECT 'Sweets', SUM(mnt_sweet_products) FROM marketing_campaigns
-            )
-            SELECT 
-                category,
-                revenue,
-                ROUND(revenue * 100.0 / (SELECT SUM(revenue) FROM product_revenue), 2) as share
-            FROM product_revenue
-            ORDER BY revenue DESC
-        """)
-        results = db.execute(query).fetchall()
-        return [
-            {
-                "category": row[0],
-                "revenue": float(row[1] or 0),
-                "share": float(row[2] or 0)
-            }
-            for row in results
-        ]
+        return _products_payload(_fetch_summary(db, filters)['overall'])
     except Exception as e:
         logger.error(f"Error fetching products: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/channels", response_model=List[ChannelData])
-async def get_channels(db: Session = Depends(get_db)):
+def get_channels(filters: Dict[str, Any] = Depends(aggregate_filters), db: Session = Depends(get_db)):
     try:
-        query = text("""
-            WITH channel_purchases AS (
-                SELECT 'Store' as channel, SUM(num_store_purchases) as purchases
-                FROM marketing_campaigns
-                UNION ALL
-                SELECT 'Web', SUM(num_web_purchases) FROM marketing_campaigns
-                UNION ALL
-                SELECT 'Catalog', SUM(num_catalog_purchases) FROM marketing_campaigns
-            )
-            SELECT 
-                channel,
-                purchases,
-                ROUND(purchases * 100.0 / (SELECT SUM(purchases) FROM channel_purchases), 2) as share
-            FROM channel_purchases
-            ORDER BY purchases DESC
-        """)
-        results = db.execute(query).fetchall()
-        return [
-            {
-                "channel": row[0],
-                "purchases": row[1],
-                "share": float(row[2] or 0)
-            }
-            for row in results
-        ]
+        return _channels_payload(_fetch_summary(db, filters)['overall'])
     except Exception as e:
         logger.error(f"Error fetching channels: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/demographics")
-async def get_demographics(db: Session = Depends(get_db)):
+def get_demographics(filters: Dict[str, Any] = Depends(aggregate_filters), db: Session = Depends(get_db)):
     try:
-        age_query = text("""
-            SELECT 
-                age_group,
-                COUNT(*) as customers,
-                ROUND(AVG(total_spent), 2) as avg_spending
-            FROM marketing_campaigns
-            GROUP BY age_group
-            ORDER BY age_group
-        """)
-        age_results = db.execute(age_query).fetchall()
-        
-        income_query = text("""
-            SELECT 
-                income_group,
-                COUNT(*) as customers,
-                ROUND(AVG(total_spent), 2) as avg_spending
-            FROM marketing_campaigns
-            GROUP BY income_group
-            ORDER BY 
-                CASE income_group
-                    WHEN 'Low' THEN 1
-                    WHEN 'Lower-Mid' THEN 2
-                    WHEN 'Mid' THEN 3
-                    WHEN 'Upper-Mid' THEN 4
-                    WHEN 'High' THEN 5
-                END
-        """)
-        income_results = db.execute(income_query).fetchall()
-        
-        return {
-            "age_groups": [
-                {"group": row[0], "customers": row[1], "avg_spending": float(row[2] or 0)}
-                for row in age_results
-            ],
-            "income_groups": [
-                {"group": row[0], "customers": row[1], "avg_spending": float(row[2] or 0)}
-                for row in income_results
-            ]
-        }
+        summary = _fetch_summary(db, filters)
+        return _demographics_payload(summary['age_group'], summary['income_group'])
     except Exception as e:
         logger.error(f"Error fetching demographics: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/insights")
-async def get_insights(db: Session = Depends(get_db)):
+def get_insights(db: Session = Depends(get_db)):
     try:
-        query = text("""
-            SELECT 
-                COUNT(*) as total_customers,
-                ROUND(AVG(age), 0) as avg_age,
-                ROUND(AVG(income), 2) as avg_income,
-                ROUND(SUM(total_spent), 2) as total_revenue,
-                (SELECT customer_segment_label FROM marketing_campaigns 
-                 GROUP BY customer_segment_label ORDER BY COUNT(*) DESC LIMIT 1) as largest_segment,
-                (SELECT COUNT(*) FROM marketing_campaigns WHERE total_spent > 1000) as high_spenders
-            FROM marketing_campaigns
-        """)
-        result = db.execute(query).fetchone()
-        
+        summary = _fetch_summary(db)
+        return _insights_payload(summary['overall'], summary['segment'])
+    except Exception as e:
+        logger.error(f"Error fetching insights: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Served from cohort_monthly, the per-enrollment-month rollup refreshed by the
+# loader, so a date range reads one row per month rather than customer rows.
+COHORTS_QUERY = text("""
+    SELECT
+        cohort_month,
+        customers,
+        total_revenue,
+        ROUND(total_revenue / NULLIF(customers, 0), 2) as avg_revenue,
+        avg_clv,
+        campaign_acceptances,
+        ROUND(campaign_acceptances::numeric / NULLIF(customers, 0), 3) as acceptances_per_customer,
+        ROUND(responses * 100.0 / NULLIF(customers, 0), 2) as response_rate
+    FROM cohort_monthly
+    WHERE (CAST(:enrolled_from AS date) IS NULL
+           OR cohort_month >= date_trunc('month', CAST(:enrolled_from AS date)))
+      AND (CAST(:enrolled_to AS date) IS NULL OR cohort_month <= CAST(:enrolled_to AS date))
+    ORDER BY cohort_month
+""")
+
+snapshot_store = SnapshotStore(
+    engine,
+    response_cache.data_version,
+    COHORTS_QUERY,
+    retry_seconds=float(os.getenv('SNAPSHOT_RETRY_SECONDS', '30')),
+) if SERVING_ENGINE == 'snapshot' else None
+
+@app.get("/api/cohorts", response_model=List[CohortData])
+def get_cohorts(
+    enrolled_from: Optional[date] = None,
+    enrolled_to: Optional[date] = None,
+    db: Session = Depends(get_db)
+):
+    try:
+        snapshot = snapshot_store.current() if snapshot_store else None
+        if snapshot is not None:
+            rows = snapshot.cohorts(enrolled_from, enrolled_to)
+        else:
+            rows = db.execute(COHORTS_QUERY, {"enrolled_from": enrolled_from, "enrolled_to": enrolled_to}).mappings()
+        return [
+            {
+                "cohort_month": row['cohort_month'],
+                "customers": row['customers'],
+                "total_revenue": float(row['total_revenue'] or 0),
+                "avg_revenue": float(row['avg_revenue'] or 0),
+                "avg_clv": float(row['avg_clv'] or 0),
+                "campaign_acceptances": row['campaign_acceptances'] or 0,
+                "acceptances_per_customer": float(row['acceptances_per_customer'] or 0),
+                "response_rate": float(row['response_rate'] or 0)
+            }
+            for row in rows
+        ]
+    except Exception as e:
+        logger.error(f"Error fetching cohorts: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/dashboard", response_model=DashboardResponse)
+def get_dashboard(db: Session = Depends(get_db)):
+    try:
+        summary = _fetch_summary(db)
+        overall = summary['overall']
         return {
-            "total_customers": result[0],
-            "avg_age": int(result[1] or 0),
-            "avg_income": float(result[2] or 0),
-            "total_revenue": float(result[3] or 0),
-            "largest_segment": result[4],
-            "high_spenders": result[5]
+            "kpis": _kpis_payload(overall),
+            "segments": _segments_payload(summary['segment']),
+            "campaigns": _campaigns_payload(overall),
+            "products": _products_payload(overall),
+            "channels": _channels_payload(overall),
+            "demographics": _demographics_payload(summary['age_group'], summary['income_group']),
+            "insights": _insights_payload(overall, summary['segment'])
         }
     except Exception as e:
-        logger.error(f"Error fetching insights: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        logger.error(f"Error fetching dashboard: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# A dashboard render in one request: each sub-request runs its endpoint's
+# handler on its own pooled session in a worker thread, so the queries run
+# concurrently and the batch takes as long as its slowest query. At most
+# BATCH_CONCURRENCY of a batch run at once, and every batch shares the
+# DB_THREADPOOL_SIZE worker threads with the other endpoints.
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', '20'))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', str(DB_POOL_SIZE)))
+
+BATCH_ENDPOINTS = {
+    'kpis': (AggregateParams, lambda params, db: get_kpis(aggregate_filters(**params), db)),
+    'segments': (NoParams, lambda params, db: get_segments(db)),
+    'campaigns': (AggregateParams, lambda params, db: get_campaigns(aggregate_filters(**params), db)),
+    'products': (AggregateParams, lambda params, db: get_products(aggregate_filters(**params), db)),
+    'channels': (AggregateParams, lambda params, db: get_channels(aggregate_filters(**params), db)),
+    'demographics': (AggregateParams, lambda params, db: get_demographics(aggregate_filters(**params), db)),
+    'insights': (NoParams, lambda params, db: get_insights(db)),
+    'dashboard': (NoParams, lambda params, db: get_dashboard(db)),
+    'cohorts': (CohortParams, lambda params, db: get_cohorts(db=db, **params)),
+}
+
+def _run_batch_item(item: BatchItem):
+    started = time.perf_counter()
+    result = {"endpoint": item.endpoint}
+    try:
+        if item.endpoint not in BATCH_ENDPOINTS:
+            raise HTTPException(status_code=404, detail=f"Unknown endpoint; expected one of {sorted(BATCH_ENDPOINTS)}")
+        params_model, handler = BATCH_ENDPOINTS[item.endpoint]
+        params = params_model.model_validate(item.params).model_dump()
+        with SessionLocal() as db:
+            result.update(status=200, data=handler(params, db))
+    except ValidationError as e:
+        result.update(status=422, error=e.errors(include_url=False, include_context=False))
+    except HTTPException as e:
+        result.update(status=e.status_code, error=e.detail)
+    except Exception as e:
+        logger.error(f"Error in batch request {item.endpoint}: {e}")
+        result.update(status=500, error=str(e))
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+@app.post("/api/batch", response_model=BatchResponse)
+async def run_batch(request: BatchRequest):
+    if len(request.requests) > BATCH_MAX_REQUESTS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_REQUESTS} requests per batch")
+    started = time.perf_counter()
+    results = [None] * len(request.requests)
+    semaphore = anyio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run(index, item):
+        async with semaphore:
+            results[index] = await anyio.to_thread.run_sync(_run_batch_item, item)
+
+    async with anyio.create_task_group() as tasks:
+        for index, item in enumerate(request.requests):
+            tasks.start_soon(run, index, item)
+    return {"elapsed_ms": round((time.perf_counter() - started) * 1000, 3), "results": results}
+
+# Segments new customers with the model saved by 01_data_cleaning.py; scoring
+# is pure NumPy over the request batch. The database is only read for the
+# loaded data's reference date, once per data version.
+SCORE_MAX_BATCH = int(os.getenv('SCORE_MAX_BATCH', '10000'))
+segment_scorer = SegmentScorer(engine=engine, data_version=response_cache.data_version)
+
+@app.post("/api/score", response_model=ScoreResponse)
+def score_customers(request: ScoreRequest):
+    if len(request.customers) > SCORE_MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {SCORE_MAX_BATCH} customers per request")
+    try:
+        model = segment_scorer.model()
+    except Exception as e:
+        logger.error(f"Error loading segmentation model: {e}")
+        raise HTTPException(status_code=503, detail=f"Segmentation model could not be loaded: {e}")
+    if model is None:
+        raise HTTPException(status_code=503, detail="No segmentation model found; run 01_data_cleaning.py first")
+    try:
+        scores = segment_scorer.score(request.customers, model) if request.customers else []
+        return {"model_version": model['version'], "scores": scores}
+    except Exception as e:
+        logger.error(f"Error scoring customers: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Customer browsing uses keyset pagination: each page continues strictly after
+# the (sort value, id) of the previous page's last row, so it is a range scan
+# on the (sort column, id) indexes built by the loader and page N costs the same
+# as page 1. The cursor is that position, base64-encoded and opaque to clients.
+CUSTOMER_COLUMNS = """
+    id, age, age_group, education, marital_status, income, income_group, dt_customer,
+    recency, total_spent, total_purchases, total_campaigns_accepted, response, clv,
+    customer_segment_label AS segment
+"""
+CUSTOMER_SORTS = {'clv': Decimal, 'total_spent': Decimal, 'recency': int}
+CUSTOMER_FILTERS = {
+    'segment': 'customer_segment_label',
+    'age_group': 'age_group',
+    'income_group': 'income_group',
+}
+CUSTOMERS_MAX_LIMIT = 500
+
+def _encode_cursor(sort, order, value, customer_id):
+    payload = json.dumps([sort, order, str(value), customer_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def _decode_cursor(cursor, sort, order):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, cursor_order, value, customer_id = json.loads(base64.urlsafe_b64decode(padded))
+        if (cursor_sort, cursor_order) != (sort, order):
+            raise ValueError("cursor belongs to a different sort order")
+        return CUSTOMER_SORTS[sort](value), int(customer_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor for this sort order")
+
+def _parse_ids(ids):
+    try:
+        parsed = [int(part) for part in ids.split(',') if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma-separated list of integers")
+    if len(parsed) > CUSTOMERS_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {CUSTOMERS_MAX_LIMIT} ids per request")
+    return parsed
+
+def _customer_filter_conditions(filters, params):
+    conditions = []
+    for name, value in filters.items():
+        if value is not None:
+            conditions.append(f"{CUSTOMER_FILTERS[name]} = :{name}")
+            params[name] = value
+    return conditions
+
+def _customers_by_id(db, ids, filters):
+    params = {"ids": ids}
+    conditions = ["id = ANY(:ids)"] + _customer_filter_conditions(filters, params)
+    rows = db.execute(
+        text(f"SELECT {CUSTOMER_COLUMNS} FROM marketing_campaigns WHERE {' AND '.join(conditions)}"),
+        params
+    ).mappings().all()
+    # Preserve the requested order; unknown ids and those the filters exclude are absent
+    by_id = {row['id']: row for row in rows}
+    return [dict(by_id[i]) for i in dict.fromkeys(ids) if i in by_id]
+
+def _customer_page_query(sort, order, conditions):
+    direction = order.upper()
+    return text(f"""
+        SELECT {CUSTOMER_COLUMNS}
+        FROM marketing_campaigns
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {sort} {direction}, id {direction}
+        LIMIT :limit
+    """)
+
+@app.get("/api/customers", response_model=CustomerPage)
+def get_customers(
+    sort: str = Query('clv', pattern='^(clv|total_spent|recency)$'),
+    order: str = Query('desc', pattern='^(asc|desc)$'),
+    limit: int = Query(50, ge=1, le=CUSTOMERS_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    segment: Optional[str] = None,
+    age_group: Optional[str] = None,
+    income_group: Optional[str] = None,
+    ids: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    filters = {'segment': segment, 'age_group': age_group, 'income_group': income_group}
+    if ids is not None:
+        try:
+            return {"customers": _customers_by_id(db, _parse_ids(ids), filters)}
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error fetching customers by id: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+    # Rows without a sort value have no keyset position and are not listed
+    conditions = [f"{sort} IS NOT NULL"]
+    params = {"limit": limit + 1}
+    conditions += _customer_filter_conditions(filters, params)
+    if cursor:
+        params["after_value"], params["after_id"] = _decode_cursor(cursor, sort, order)
+        comparison = '<' if order == 'desc' else '>'
+        conditions.append(f"({sort}, id) {comparison} (:after_value, :after_id)")
+
+    try:
+        rows = [dict(row) for row in db.execute(_customer_page_query(sort, order, conditions), params).mappings().all()]
+    except Exception as e:
+        logger.error(f"Error fetching customers: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_cursor(sort, order, last[sort], last['id'])
+    return {"customers": rows, "next_cursor": next_cursor}
+
+# Full customer extracts stream through a server-side cursor, one batch of
+# EXPORT_FETCH_SIZE rows at a time, so worker memory does not grow with the
+# export. Each export holds a pooled connection until it finishes, so at most
+# EXPORT_CONCURRENCY run at once and further ones are refused with 429.
+EXPORT_FETCH_SIZE = int(os.getenv('EXPORT_FETCH_SIZE', '5000'))
+EXPORT_CONCURRENCY = int(os.getenv('EXPORT_CONCURRENCY', '2'))
+export_slots = threading.BoundedSemaphore(EXPORT_CONCURRENCY)
+
+@app.get("/api/export")
+def export_customers(
+    format: str = Query('csv', pattern='^(csv|ndjson|arrow)$'),
+    gzip: bool = False,
+    filters: Dict[str, Any] = Depends(aggregate_filters)
+):
+    if not export_slots.acquire(blocking=False):
+        raise HTTPException(status_code=429, detail=f"At most {EXPORT_CONCURRENCY} exports at a time")
+    try:
+        encoder = EXPORT_ENCODERS[format]()
+        stream = ExportStream(
+            engine, [AGGREGATE_FILTERS[name] for name in filters], filters, encoder,
+            compress=gzip, fetch_size=EXPORT_FETCH_SIZE, on_close=export_slots.release
+        )
+    except Exception as e:
+        export_slots.release()
+        logger.error(f"Error starting export: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    filename = f"marketing_campaigns.{encoder.extension}" + ('.gz' if gzip else '')
+    # Starlette does not close the iterator when the client disconnects, so the
+    # stream is also closed once the response ends, however it ends
+    return StreamingResponse(
+        stream,
+        media_type='application/gzip' if gzip else encoder.media_type,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+        background=BackgroundTask(stream.close)
+    )
+
+# Plan diagnostics (see diagnostics.py): the endpoint queries, with typical
+# parameters, and the showcase queries can be explained on demand, and their
+# plans are compared with the previous capture to catch regressions after a
+# reload. Exports are left out, as explaining one reads the whole table.
+SHOWCASE_SQL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts', '04_sql_queries.sql')
+
+plan_recorder.register('api.summary', SUMMARY_QUERY)
+plan_recorder.register('api.summary_by_segment', _filtered_summary_query({'segment': 'Champions'}),
+                       {'segment': 'Champions'})
+plan_recorder.register('api.summary_by_enrollment',
+                       _filtered_summary_query({'enrolled_from': None, 'enrolled_to': None}),
+                       {'enrolled_from': date(2013, 1, 1), 'enrolled_to': date(2013, 12, 31)})
+plan_recorder.register('api.cohorts', COHORTS_QUERY, {'enrolled_from': None, 'enrolled_to': None})
+plan_recorder.register('api.customers', _customer_page_query('clv', 'desc', ['clv IS NOT NULL']), {'limit': 51})
+plan_recorder.register('api.customers_by_segment',
+                       _customer_page_query('clv', 'desc', ['clv IS NOT NULL', 'customer_segment_label = :segment']),
+                       {'segment': 'Champions', 'limit': 51})
+for name, statement in read_named_queries(SHOWCASE_SQL_PATH, 'showcase').items():
+    plan_recorder.register(name, statement)
+
+@app.get("/api/diagnostics/plans")
+def list_query_plans(
+    query: Optional[str] = None,
+    flagged: bool = False,
+    limit: int = Query(50, ge=1, le=500)
+):
+    try:
+        return {"named_queries": plan_recorder.named_queries(), "plans": plan_recorder.history(query, flagged, limit)}
+    except Exception as e:
+        logger.error(f"Error listing query plans: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/diagnostics/plans")
+def capture_query_plans(query: Optional[List[str]] = Query(None)):
+    unknown = sorted(set(query or []) - set(plan_recorder.named_queries()))
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown queries: {', '.join(unknown)}")
+    plans = plan_recorder.capture_named(query)
+    return {
+        "captured": sum(1 for plan in plans if 'error' not in plan),
+        "failed": [plan['query_name'] for plan in plans if 'error' in plan],
+        "flagged": [plan['query_name'] for plan in plans if plan.get('shape_changed') or plan.get('buffers_changed')],
+        "plans": plans,
+    }
+
+@app.get("/api/diagnostics/plans/{plan_id}")
+def get_query_plan(plan_id: int):
+    try:
+        plan = plan_recorder.plan(plan_id)
+    except Exception as e:
+        logger.error(f"Error fetching query plan: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if plan is None:
+        raise HTTPException(status_code=404, detail="No such plan")
+    return plan
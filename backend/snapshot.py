@@ -0,0 +1,346 @@
+"""In-memory NumPy serving engine for the aggregate endpoints.
+
+With SERVING_ENGINE=snapshot the API loads marketing_campaigns once into
+typed column arrays and answers the summary endpoints without querying
+Postgres. At load time every measure of sql/marketing_summary.sql is summed
+into a cube over (segment, age group, income group, education), so an
+unfiltered or group-filtered request only slices and adds up a few hundred
+cells. Rows are kept sorted by enrollment date, so an enrollment range is a
+contiguous slice that is re-binned with one bincount per measure.
+
+Money is loaded as integer cents and averages are rounded with Decimal,
+half away from zero, so the payloads equal the ones computed by the SQL.
+A snapshot is tagged with the data version it was read with. When the
+loader stamps a new version, a background thread builds the next snapshot
+while requests fall back to Postgres, and the new one is swapped in whole.
+"""
+import io
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from cache import DATA_VERSION_QUERY
+
+logger = logging.getLogger(__name__)
+
+# Filter name -> column; the first three are also the summary's group levels
+CUBE_COLUMNS = {
+    'segment': 'customer_segment_label',
+    'age_group': 'age_group',
+    'income_group': 'income_group',
+    'education': 'education',
+}
+GROUP_LEVELS = ['segment', 'age_group', 'income_group']
+# The CASE of server.SUMMARY_ORDER; other values sort after these
+INCOME_GROUP_ORDER = ['Low', 'Lower-Mid', 'Mid', 'Upper-Mid', 'High']
+
+# Summed per cube cell. NULLs are skipped and counted apart, like SUM and AVG.
+MEASURES = {
+    'total_spent': '(total_spent * 100)::bigint',
+    'clv': '(clv * 100)::bigint',
+    'age': 'age',
+    'income': '(income * 100)::bigint',
+    'responded': 'CASE WHEN total_campaigns_accepted > 0 THEN 1 ELSE 0 END',
+    'high_spender': 'CASE WHEN total_spent > 1000 THEN 1 ELSE 0 END',
+    **{f'cmp{n}': f'accepted_cmp{n}' for n in range(1, 6)},
+    'wines_revenue': 'mnt_wines',
+    'meat_revenue': 'mnt_meat_products',
+    'fish_revenue': 'mnt_fish_products',
+    'gold_revenue': 'mnt_gold_prods',
+    'fruits_revenue': 'mnt_fruits',
+    'sweets_revenue': 'mnt_sweet_products',
+    'store_purchases': 'num_store_purchases',
+    'web_purchases': 'num_web_purchases',
+    'catalog_purchases': 'num_catalog_purchases',
+}
+MEASURE_INDEX = {name: i for i, name in enumerate(MEASURES)}
+SUM_MEASURES = ['wines_revenue', 'meat_revenue', 'fish_revenue', 'gold_revenue', 'fruits_revenue',
+                'sweets_revenue', 'store_purchases', 'web_purchases', 'catalog_purchases']
+SUMMARY_CACHE_SIZE = 1024
+
+SNAPSHOT_COPY = "COPY (SELECT {columns} FROM marketing_campaigns) TO STDOUT WITH CSV HEADER".format(
+    columns=', '.join(
+        [f"{column} AS {name}" for name, column in CUBE_COLUMNS.items()] +
+        ['dt_customer'] +
+        [f"{expression} AS {name}" for name, expression in MEASURES.items()]
+    )
+)
+# Group values in the database's collation, which orders the SQL's rows
+GROUP_VALUES_QUERY = text("""
+    SELECT level, group_value FROM marketing_summary
+    WHERE level <> 'overall' AND group_value IS NOT NULL
+    ORDER BY level, group_value
+""")
+
+
+def _narrow(values):
+    """Smallest integer dtype that holds `values`."""
+    for dtype in ('int8', 'int16', 'int32'):
+        info = np.iinfo(dtype)
+        if not len(values) or (values.min() >= info.min and values.max() <= info.max):
+            return values.astype(dtype)
+    return values
+
+
+def _decimal(value, places):
+    return value.quantize(Decimal(1).scaleb(-places), rounding=ROUND_HALF_UP)
+
+
+def _round_sum(total, scale=1):
+    return _decimal(Decimal(int(total)) / scale, 2)
+
+
+def _round_avg(total, count, scale=1, places=2):
+    # ROUND(AVG(x) * scale, places) on numerics; NULL without values
+    if not count:
+        return None
+    return _decimal(Decimal(int(total)) * scale / Decimal(int(count)), places)
+
+
+class Snapshot:
+    """One immutable copy of marketing_campaigns, tagged with its data version."""
+
+    def __init__(self, frame, categories, cohorts, version, load_seconds):
+        self.version = version
+        self.loaded_at = datetime.now(timezone.utc)
+        self.load_seconds = load_seconds
+        self.rows = len(frame)
+        self.categories = categories
+        self.cohort_rows = cohorts
+        self.shape = tuple(len(categories[name]) + 1 for name in CUBE_COLUMNS)
+
+        # Customers without an enrollment date sort last and match no date filter
+        frame = frame.sort_values('dt_customer', kind='stable')
+        self.dt_customer = frame['dt_customer'].to_numpy(dtype='datetime64[D]')
+        self.dated = int((~np.isnat(self.dt_customer)).sum())
+        # NULL or unknown values get the extra last code of their dimension
+        codes = []
+        for name in CUBE_COLUMNS:
+            values = pd.Categorical(frame[name], categories=categories[name]).codes.astype('int64')
+            codes.append(np.where(values < 0, len(categories[name]), values))
+        self.cells = np.ravel_multi_index(codes, self.shape).astype('int32')
+        self.values = {}
+        self.valid = {}
+        for name in MEASURES:
+            column = frame[name].to_numpy(dtype='float64')
+            missing = np.isnan(column)
+            self.values[name] = _narrow(np.where(missing, 0, column).astype('int64'))
+            self.valid[name] = ~missing if missing.any() else None
+        self.cube = self._cube(slice(None))
+        # Summaries are immutable once computed, so each filter combination is built once
+        self._summaries = {}
+
+    def _cube(self, rows):
+        """Per-cell customers, measure sums and non-NULL counts of `rows`."""
+        size = int(np.prod(self.shape))
+        cells = self.cells[rows]
+        customers = np.bincount(cells, minlength=size)
+        sums = np.empty((size, len(MEASURES)))
+        counts = np.empty((size, len(MEASURES)))
+        for i, name in enumerate(MEASURES):
+            valid = self.valid[name]
+            sums[:, i] = np.bincount(cells, weights=self.values[name][rows], minlength=size)
+            counts[:, i] = customers if valid is None else np.bincount(cells, weights=valid[rows], minlength=size)
+        return (customers.reshape(self.shape),
+                sums.reshape(self.shape + (-1,)),
+                counts.reshape(self.shape + (-1,)))
+
+    def nbytes(self):
+        arrays = [self.dt_customer, self.cells, *self.values.values(),
+                  *(valid for valid in self.valid.values() if valid is not None), *self.cube]
+        return sum(array.nbytes for array in arrays)
+
+    def summary(self, filters=None):
+        """marketing_summary rows for the matching customers, shaped like server._fetch_summary."""
+        filters = filters or {}
+        key = tuple(sorted(filters.items()))
+        summary = self._summaries.get(key)
+        if summary is None:
+            summary = self._summarize(filters)
+            if len(self._summaries) < SUMMARY_CACHE_SIZE:
+                self._summaries[key] = summary
+        return summary
+
+    def _summarize(self, filters):
+        if 'enrolled_from' in filters or 'enrolled_to' in filters:
+            start = 0
+            stop = self.dated
+            if 'enrolled_from' in filters:
+                start = np.searchsorted(self.dt_customer, np.datetime64(filters['enrolled_from'], 'D'), 'left')
+            if 'enrolled_to' in filters:
+                stop = np.searchsorted(self.dt_customer, np.datetime64(filters['enrolled_to'], 'D'), 'right')
+            customers, sums, counts = self._cube(slice(start, max(start, stop)))
+        else:
+            customers, sums, counts = self.cube
+
+        # Equality filters keep one index of their dimension, or none if unknown
+        codes = [np.arange(size) for size in self.shape]
+        for axis, name in enumerate(CUBE_COLUMNS):
+            if name not in filters:
+                continue
+            values = self.categories[name]
+            keep = [values.index(filters[name])] if filters[name] in values else []
+            codes[axis] = np.asarray(keep, dtype='int64')
+            customers = np.take(customers, keep, axis=axis)
+            sums = np.take(sums, keep, axis=axis)
+            counts = np.take(counts, keep, axis=axis)
+
+        axes = tuple(range(len(CUBE_COLUMNS)))
+        summary = {'overall': self._row('overall', None, customers.sum(), sums.sum(axis=axes),
+                                        counts.sum(axis=axes))}
+        for axis, level in enumerate(GROUP_LEVELS):
+            others = tuple(other for other in axes if other != axis)
+            level_customers = customers.sum(axis=others)
+            level_sums = sums.sum(axis=others)
+            level_counts = counts.sum(axis=others)
+            rows = []
+            for i in np.flatnonzero(level_customers):
+                code = codes[axis][i]
+                value = self.categories[level][code] if code < len(self.categories[level]) else None
+                rows.append(self._row(level, value, level_customers[i], level_sums[i], level_counts[i]))
+            summary[level] = self._order(level, rows)
+        return summary
+
+    def _order(self, level, rows):
+        # Rows come in group_value order (NULL last), as the tie-break of SUMMARY_ORDER
+        if level == 'segment':
+            return sorted(rows, key=lambda row: (row['avg_clv'] is not None, -(row['avg_clv'] or 0)))
+        if level == 'income_group':
+            rank = {value: i for i, value in enumerate(INCOME_GROUP_ORDER)}
+            return sorted(rows, key=lambda row: rank.get(row['group_value'], len(rank)))
+        return rows
+
+    @staticmethod
+    def _row(level, group_value, customers, sums, counts):
+        sums = sums.tolist()
+        counts = counts.tolist()
+
+        def total(name):
+            return sums[MEASURE_INDEX[name]]
+
+        def count(name):
+            return counts[MEASURE_INDEX[name]]
+
+        row = {
+            'level': level,
+            'group_value': group_value,
+            'customers': int(customers),
+            'total_revenue': _round_sum(total('total_spent'), 100) if count('total_spent') else None,
+            'avg_spending': _round_avg(total('total_spent'), count('total_spent'), Decimal('0.01')),
+            'avg_clv': _round_avg(total('clv'), count('clv'), Decimal('0.01')),
+            'avg_age': _round_avg(total('age'), count('age'), places=0),
+            'avg_income': _round_avg(total('income'), count('income'), Decimal('0.01')),
+            'response_rate': _round_avg(total('responded'), customers, 100),
+            'high_spenders': int(total('high_spender')),
+        }
+        for n in range(1, 6):
+            name = f'cmp{n}'
+            row[f'{name}_acceptances'] = int(total(name)) if count(name) else None
+            row[f'{name}_rate'] = _round_avg(total(name), count(name), 100)
+        for name in SUM_MEASURES:
+            row[name] = int(total(name)) if count(name) else None
+        return row
+
+    def cohorts(self, enrolled_from=None, enrolled_to=None):
+        """cohort_monthly rows in the range, as the /api/cohorts query selects them."""
+        start = enrolled_from.replace(day=1) if enrolled_from else None
+        return [
+            row for row in self.cohort_rows
+            if (start is None or row['cohort_month'] >= start)
+            and (enrolled_to is None or row['cohort_month'] <= enrolled_to)
+        ]
+
+    def stats(self):
+        return {
+            "data_version": self.version,
+            "rows": self.rows,
+            "loaded_at": self.loaded_at.isoformat(timespec='seconds'),
+            "load_seconds": round(self.load_seconds, 3),
+            "memory_mb": round(self.nbytes() / 2 ** 20, 2),
+        }
+
+
+def load_snapshot(engine, cohort_query):
+    """Read the table, group values, cohorts and data version in one transaction."""
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        conn.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY"))
+        version = conn.execute(DATA_VERSION_QUERY).scalar()
+        categories = {name: [] for name in CUBE_COLUMNS}
+        for level, value in conn.execute(GROUP_VALUES_QUERY):
+            categories[level].append(value)
+        cohorts = [dict(row) for row in conn.execute(
+            cohort_query, {"enrolled_from": None, "enrolled_to": None}).mappings()]
+
+        buffer = io.StringIO()
+        conn.connection.dbapi_connection.cursor().copy_expert(SNAPSHOT_COPY, buffer)
+        buffer.seek(0)
+        frame = pd.read_csv(buffer, dtype={name: 'category' for name in CUBE_COLUMNS},
+                            parse_dates=['dt_customer'])
+    del buffer
+    categories['education'] = sorted(frame['education'].dropna().unique())
+    return Snapshot(frame, categories, cohorts, version, time.perf_counter() - started)
+
+
+class SnapshotStore:
+    """The current snapshot, rebuilt in the background when the data version changes.
+
+    `current()` returns None while no snapshot matches the live data version,
+    and the caller serves that request from Postgres.
+    """
+
+    def __init__(self, engine, data_version, cohort_query, retry_seconds=30.0):
+        self.engine = engine
+        self.data_version = data_version
+        self.cohort_query = cohort_query
+        self.retry_seconds = retry_seconds
+        self._snapshot = None
+        self._loading = False
+        self._last_failure = float('-inf')
+        self._lock = threading.Lock()
+
+    def load(self):
+        snapshot = load_snapshot(self.engine, self.cohort_query)
+        if snapshot.version is None:
+            raise RuntimeError("marketing_campaigns has no data version; reload it with 03_load_to_postgres.py")
+        self._snapshot = snapshot
+        logger.info(f"Serving snapshot {snapshot.version}: {snapshot.rows} customers, "
+                    f"{snapshot.nbytes() / 2 ** 20:.1f} MB, loaded in {snapshot.load_seconds:.2f}s")
+        return snapshot
+
+    def current(self):
+        snapshot = self._snapshot
+        version = self.data_version()
+        if snapshot is not None and version is not None and snapshot.version == version:
+            return snapshot
+        if version is not None:
+            self._reload_in_background()
+        return None
+
+    def _reload_in_background(self):
+        with self._lock:
+            if self._loading or time.monotonic() - self._last_failure < self.retry_seconds:
+                return
+            self._loading = True
+        threading.Thread(target=self._reload, name='snapshot-reload', daemon=True).start()
+
+    def _reload(self):
+        try:
+            self.load()
+        except Exception as e:
+            self._last_failure = time.monotonic()
+            logger.warning(f"Snapshot reload failed, serving from Postgres: {e}")
+        finally:
+            with self._lock:
+                self._loading = False
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {"engine": "snapshot", "loading": self._loading,
+                **(snapshot.stats() if snapshot is not None else {"data_version": None})}
@@ -1,44 +1,29 @@
+import argparse
+import glob
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-from datetime import datetime
-import os
+from pandas.api.types import union_categoricals
+from dataset_io import (CLEANED_DATA_PATHS, PARTITIONED_DATA_PATH, CleanedWriter, read_cleaned, resolve_output,
+                        write_cleaned)
+from features import (AGE_BINS, AGE_LABELS, CAMPAIGN_COLS, INCOME_BINS, INCOME_LABELS, REFERENCE_DATE_ENV,
+                      add_totals, age, bucket, clv, reference_date, tenure_days)
+from schema import (DATE_COLUMNS, INTEGER_DTYPES, RAW_READ_DTYPES, apply_schema, log_memory, memory_mb,
+                    nullable_integers)
+from segmentation import (RFM_COLS, StreamingFit, add_model_args, assign_segment, fit_from_args, label_column,
+                          load_model, print_k_report, save_model)
 
-print("=" * 60)
-print("MARKETING CAMPAIGN DATA CLEANING SCRIPT")
-print("=" * 60)
-
-# Load the dataset
-print("\n[1/6] Loading dataset")
-df = pd.read_csv('/app/marketing_campaign.csv', sep=';', encoding='utf-8-sig')
-print(f"Loaded {len(df)} records with {len(df.columns)} columns")
-
-# Display basic info
-print("\n[2/6] Analyzing data structure...")
-print(f"   - Shape: {df.shape}")
-print(f"   - Columns: {list(df.columns)}")
-print(f"   - Missing values:")
-missing = df.isnull().sum()
-for col, count in missing[missing > 0].items():
-    print(f"     • {col}: {count} ({count/len(df)*100:.2f}%)")
-
-# Data Cleaning Steps
-print("\n[3/6] Cleaning data")
-
-# 1. Handle missing Income values
-print("   - Handling missing Income values...")
-if df['Income'].isnull().sum() > 0:
-    median_income = df['Income'].median()
-    df['Income'].fillna(median_income, inplace=True)
-    print(f"Filled {df['Income'].isnull().sum()} missing values with median: ${median_income:,.2f}")
+RAW_DATA_PATH = '/app/marketing_campaign.csv'
 
-# 2. Clean Year_Birth - remove unrealistic values
-print("Cleaning Year_Birth")
-current_year = datetime.now().year
-df = df[(df['Year_Birth'] >= 1940) & (df['Year_Birth'] <= current_year - 18)]
-print(f"Removed records with invalid birth years")
+# Typed as declared in schema.py, through read_extract(). Income is always
+# parsed as float so that a chunk without missing incomes is written exactly
+# like the full frame (58138.0, not 58138).
+READ_OPTIONS = {'sep': ';', 'encoding': 'utf-8-sig', 'dtype': RAW_READ_DTYPES, 'parse_dates': DATE_COLUMNS}
+READ_CHUNK_ROWS = 100000
 
-# 3. Clean Marital_Status - standardize values
-print("Standardizing Marital_Status")
 marital_mapping = {
     'Married': 'Married',
     'Together': 'Married',
@@ -49,95 +34,492 @@ marital_mapping = {
     'Absurd': 'Other',
     'YOLO': 'Other'
 }
-df['Marital_Status'] = df['Marital_Status'].map(marital_mapping)
-print(f"Standardized marital status categories")
-
-# 4. Feature Engineering
-print("\n[4/6] Engineering new features...")
-
-# Age
-df['Age'] = current_year - df['Year_Birth']
-print(f"Created Age column")
-
-# Total Spending
-spending_cols = ['MntWines', 'MntFruits', 'MntMeatProducts', 'MntFishProducts', 'MntSweetProducts', 'MntGoldProds']
-df['TotalSpent'] = df[spending_cols].sum(axis=1)
-print(f"Created TotalSpent column")
-
-# Total Purchases
-purchase_cols = ['NumWebPurchases', 'NumCatalogPurchases', 'NumStorePurchases']
-df['TotalPurchases'] = df[purchase_cols].sum(axis=1)
-print(f"Created TotalPurchases column")
-
-# Total Children
-df['TotalChildren'] = df['Kidhome'] + df['Teenhome']
-print(f"Created TotalChildren column")
-
-# Total Campaigns Accepted
-campaign_cols = ['AcceptedCmp1', 'AcceptedCmp2', 'AcceptedCmp3', 'AcceptedCmp4', 'AcceptedCmp5']
-df['TotalCampaignsAccepted'] = df[campaign_cols].sum(axis=1)
-print(f"Created TotalCampaignsAccepted column")
-
-# Customer Tenure (days)
-df['Dt_Customer'] = pd.to_datetime(df['Dt_Customer'])
-df['CustomerTenureDays'] = (datetime.now() - df['Dt_Customer']).dt.days
-print(f"Created CustomerTenureDays column")
-
-# Customer Lifetime Value (CLV)
-df['CLV'] = df['TotalSpent'] / (df['CustomerTenureDays'] / 365.25)
-df['CLV'] = df['CLV'].replace([np.inf, -np.inf], 0)
-print(f"Created CLV (Customer Lifetime Value) column")
-
-# Income Groups
-df['IncomeGroup'] = pd.cut(df['Income'], 
-                            bins=[0, 30000, 50000, 75000, 100000, float('inf')],
-                            labels=['Low', 'Lower-Mid', 'Mid', 'Upper-Mid', 'High'])
-print(f"Created IncomeGroup column")
-
-# Age Groups
-df['AgeGroup'] = pd.cut(df['Age'], 
-                        bins=[0, 30, 40, 50, 60, float('inf')],
-                        labels=['<30', '30-40', '40-50', '50-60', '60+'])
-print(f"Created AgeGroup column")
-
-# RFM Segmentation
-print("\n[5/6] Performing RFM segmentation")
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-
-# Prepare RFM features
-rfm_data = df[['Recency', 'TotalPurchases', 'TotalSpent']].copy()
-scaler = StandardScaler()
-rfm_scaled = scaler.fit_transform(rfm_data)
-
-# K-Means clustering
-kmeans = KMeans(n_clusters=4, random_state=42, n_init=10)
-df['CustomerSegment'] = kmeans.fit_predict(rfm_scaled)
-
-# Label segments based on characteristics
-segment_labels = {0: 'Champions', 1: 'At Risk', 2: 'Potential', 3: 'Lost'}
-df['CustomerSegmentLabel'] = df['CustomerSegment'].map(segment_labels)
-print(f"   ✓ Created customer segments using K-Means clustering")
-
-# Save cleaned data
-print("\nSaving cleaned data")
-output_path = '/app/data/marketing_campaign_cleaned.csv'
-os.makedirs('/app/data', exist_ok=True)
-df.to_csv(output_path, index=False)
-print(f"Saved to {output_path}")
-
-# Summary Statistics
-print("\n" + "=" * 60)
-print("CLEANING SUMMARY")
-print("=" * 60)
-print(f"Total Records: {len(df)}")
-print(f"Total Features: {len(df.columns)}")
-print(f"\nNew Features Created:")
-print("  • Age, TotalSpent, TotalPurchases, TotalChildren")
-print("  • TotalCampaignsAccepted, CustomerTenureDays, CLV")
-print("  • IncomeGroup, AgeGroup, CustomerSegment")
-print("\nData Quality:")
-print(f"  • Missing Values: {df.isnull().sum().sum()}")
-print(f"  • Duplicate Records: {df.duplicated().sum()}")
-print("\n✓ Data cleaning completed successfully!")
-print("=" * 60)
\ No newline at end of file
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Clean the raw campaign extract and engineer features")
+    parser.add_argument('--input', default=RAW_DATA_PATH)
+    parser.add_argument('--shards', metavar='GLOB',
+                        help="Clean every extract matching this pattern (e.g. 'extracts/2024-*.csv') across "
+                             "a process pool into a partitioned Parquet dataset, one file per shard")
+    parser.add_argument('--jobs', type=int,
+                        help="Processes used with --shards (default: CPU count)")
+    parser.add_argument('--output',
+                        help="Cleaned dataset path (default: /app/data/marketing_campaign_cleaned.<format>, "
+                             f"or the {PARTITIONED_DATA_PATH} directory with --shards)")
+    parser.add_argument('--format', choices=sorted(CLEANED_DATA_PATHS),
+                        help="Output format; Parquet unless the --output extension says otherwise")
+    parser.add_argument('--chunk-size', type=int,
+                        help="Process the file in three streaming passes of this many rows "
+                             "instead of loading it into memory")
+    parser.add_argument('--reference-date', type=reference_date,
+                        help=f"Date ages and tenure are computed as of, YYYY-MM-DD "
+                             f"(default: ${REFERENCE_DATE_ENV} or today)")
+    add_model_args(parser)
+    parser.add_argument('--refit', action='store_true',
+                        help="Fit a new segmentation model even if a saved one exists "
+                             "(the --k and --algorithm options only apply to new fits)")
+    args = parser.parse_args()
+    if args.shards and args.chunk_size:
+        parser.error("--chunk-size does not apply to --shards; each shard is cleaned in memory by one process")
+    if args.shards and args.format not in (None, 'parquet'):
+        parser.error("--shards writes a partitioned Parquet dataset")
+    return args
+
+
+def read_extract(path, chunksize=None):
+    """The extract with the column types of schema.RAW_DTYPES; an iterator of
+    frames of `chunksize` rows when it is given.
+
+    The file is always parsed in chunks: read_csv needs several times the
+    frame's size to parse float columns in one go.
+    """
+    chunks = (nullable_integers(chunk)
+              for chunk in pd.read_csv(path, chunksize=chunksize or READ_CHUNK_ROWS, **READ_OPTIONS))
+    if chunksize:
+        return chunks
+    frames = list(chunks)
+    if not frames:
+        return nullable_integers(pd.read_csv(path, **READ_OPTIONS))
+    # Categories merged and sorted as read_csv merges those of its own chunks
+    for col in frames[0].select_dtypes('category').columns:
+        categories = union_categoricals([frame[col] for frame in frames], sort_categories=True).categories
+        for frame in frames:
+            frame[col] = frame[col].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+def filter_birth_years(df, current_year):
+    # A blank Year_Birth is NA, which the mask treats as False
+    return df[(df['Year_Birth'] >= 1940) & (df['Year_Birth'] <= current_year - 18)]
+
+
+def valid_rows(df, current_year):
+    """Rows with a plausible birth year and every count present, with the
+    counts narrowed from the extract's nullable integers to NumPy ones."""
+    df = filter_birth_years(df, current_year)
+    df = df[df[list(INTEGER_DTYPES)].notna().all(axis=1)].copy()
+    return apply_schema(df, INTEGER_DTYPES)
+
+
+def clean_frame(df, median_income, current_year):
+    """Income imputation, birth-year filter and marital status standardization."""
+    df['Income'] = df['Income'].fillna(median_income)
+    return clean_rows(df, current_year)
+
+
+def clean_rows(df, current_year):
+    """The cleaning steps that need no statistics of the whole dataset."""
+    df = valid_rows(df, current_year)
+    df['Marital_Status'] = df['Marital_Status'].map(marital_mapping)
+    return df
+
+
+def impute_income(df, median_income):
+    """Income imputation for frames whose features were engineered before the
+    median was known; only IncomeGroup depends on Income."""
+    df['Income'] = df['Income'].fillna(median_income)
+    df['IncomeGroup'] = group_column(df['Income'], INCOME_BINS, INCOME_LABELS)
+    return df
+
+
+def engineer_features(df, as_of):
+    df['Age'] = age(df['Year_Birth'], as_of)
+    add_totals(df)
+    df['TotalChildren'] = df['Kidhome'] + df['Teenhome']
+    df['TotalCampaignsAccepted'] = df[CAMPAIGN_COLS].sum(axis=1)
+
+    # Customer Tenure (days)
+    df['Dt_Customer'] = pd.to_datetime(df['Dt_Customer'])
+    df['CustomerTenureDays'] = tenure_days(df['Dt_Customer'], as_of)
+
+    # Customer Lifetime Value (CLV)
+    df['CLV'] = clv(df['TotalSpent'], df['CustomerTenureDays'])
+
+    df['IncomeGroup'] = group_column(df['Income'], INCOME_BINS, INCOME_LABELS)
+    df['AgeGroup'] = group_column(df['Age'], AGE_BINS, AGE_LABELS)
+    return apply_schema(df)
+
+
+def group_column(values, bins, labels):
+    # Ordered categorical, as pd.cut returned, so the written dataset is unchanged
+    return pd.Categorical(bucket(values, bins, labels), categories=labels, ordered=True)
+
+
+def fit_segments(args, rfm, median_income):
+    """Fit the RFM scaler and K-Means model on the full (Recency, Frequency, Monetary) matrix."""
+    return save_segments(args, fit_from_args(args, rfm, income_median=float(median_income)))
+
+
+def save_segments(args, model):
+    if model['k_selection']:
+        print_k_report(model['k_selection'], model['params']['n_clusters'])
+    path = save_model(model, args.model_dir)
+    print(f"   ✓ Fitted segmentation model {model['version']} on {model['n_samples']} customers "
+          f"({model['params']['algorithm']}, k={model['params']['n_clusters']})")
+    print(f"   ✓ Saved to {path}")
+    return load_model(path=path)
+
+
+def saved_model(args):
+    if args.refit:
+        return None
+    model = load_model(args.model_dir)
+    if model is not None:
+        print(f"   ✓ Using saved segmentation model {model['version']} (--refit to retrain)")
+    return model
+
+
+def assign_segments(df, model):
+    segments = assign_segment(df[RFM_COLS].to_numpy(), model)
+    df['CustomerSegment'] = segments
+    df['CustomerSegmentLabel'] = label_column(segments, model)
+    return apply_schema(df)
+
+
+def row_hashes(df):
+    # One uint64 per row; duplicated() would factorize every column at once
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def count_duplicates(hashes):
+    return len(hashes) - len(np.unique(hashes))
+
+
+def print_missing(missing, total_rows):
+    print(f"   - Missing values:")
+    for col, count in missing[missing > 0].items():
+        print(f"     • {col}: {count} ({count/total_rows*100:.2f}%)")
+
+
+def print_summary(total_records, total_features, missing_values, duplicates):
+    print("\n" + "=" * 60)
+    print("CLEANING SUMMARY")
+    print("=" * 60)
+    print(f"Total Records: {total_records}")
+    print(f"Total Features: {total_features}")
+    print(f"\nNew Features Created:")
+    print("  • Age, TotalSpent, TotalPurchases, TotalChildren")
+    print("  • TotalCampaignsAccepted, CustomerTenureDays, CLV")
+    print("  • IncomeGroup, AgeGroup, CustomerSegment")
+    print("\nData Quality:")
+    print(f"  • Missing Values: {missing_values}")
+    print(f"  • Duplicate Records: {duplicates}")
+    print("\n✓ Data cleaning completed successfully!")
+    print("=" * 60)
+
+
+def run_in_memory(args, as_of):
+    # Load the dataset
+    print("\n[1/6] Loading dataset")
+    df = read_extract(args.input)
+    print(f"Loaded {len(df)} records with {len(df.columns)} columns")
+    log_memory(df, 'Extract')
+
+    # Display basic info
+    print("\n[2/6] Analyzing data structure...")
+    print(f"   - Shape: {df.shape}")
+    print(f"   - Columns: {list(df.columns)}")
+    print_missing(df.isnull().sum(), len(df))
+
+    # Data Cleaning Steps
+    print("\n[3/6] Cleaning data")
+    missing_income = df['Income'].isnull().sum()
+    median_income = df['Income'].median()
+    df = clean_frame(df, median_income, as_of.year)
+    print(f"Filled {missing_income} missing Income values with median: ${median_income:,.2f}")
+    print(f"Removed records with invalid birth years or blank counts")
+    print(f"Standardized marital status categories")
+
+    # Feature Engineering
+    print("\n[4/6] Engineering new features...")
+    df = engineer_features(df, as_of)
+    print(f"Created Age, TotalSpent, TotalPurchases, TotalChildren, TotalCampaignsAccepted,")
+    print(f"CustomerTenureDays, CLV, IncomeGroup and AgeGroup columns")
+
+    # RFM Segmentation
+    print("\n[5/6] Performing RFM segmentation")
+    model = saved_model(args) or fit_segments(args, df[RFM_COLS].to_numpy(dtype='float64'), median_income)
+    df = assign_segments(df, model)
+    print(f"   ✓ Created customer segments using K-Means clustering")
+
+    # Save cleaned data
+    print("\n[6/6] Saving cleaned data")
+    log_memory(df, 'Cleaned frame')
+    write_cleaned(df, args.output, args.format)
+    print(f"Saved to {args.output} ({args.format})")
+
+    print_summary(len(df), len(df.columns), df.isnull().sum().sum(), count_duplicates(row_hashes(df)))
+
+
+class StreamingMedian:
+    """Exact median of values read in a stream, without keeping them all.
+
+    `count()` sees every value once and only tallies it into fixed
+    log-spaced bins (BINS_PER_DECADE per power of ten, everything up to 1 in
+    one bin). `refine()` sees the values again and keeps the distinct values
+    of the one or two bins holding the middle ranks, so memory depends on
+    the spread of the data around the median, not on the number of rows.
+    """
+    BINS_PER_DECADE = 1000
+
+    def __init__(self):
+        self.n = 0
+        self.bin_counts = {}
+        self.targets = None
+        self.values = {}
+
+    def _bins(self, values):
+        return np.floor(np.log10(np.maximum(values, 1)) * self.BINS_PER_DECADE).astype('int64')
+
+    @staticmethod
+    def _tally(counts, keys):
+        for key, count in zip(*np.unique(keys, return_counts=True)):
+            counts[key] = counts.get(key, 0) + int(count)
+
+    def count(self, values):
+        values = values[~np.isnan(values)]
+        self.n += len(values)
+        self._tally(self.bin_counts, self._bins(values))
+
+    def refine(self, values):
+        if self.targets is None:
+            self.targets = self._locate()
+        values = values[~np.isnan(values)]
+        wanted = np.isin(self._bins(values), [key for key, _ in self.targets])
+        self._tally(self.values, values[wanted])
+
+    def _locate(self):
+        """(bin, rank within bin) of the middle rank(s): one for an odd count, two for an even one."""
+        targets = []
+        for rank in sorted({(self.n - 1) // 2, self.n // 2}):
+            below = 0
+            for key in sorted(self.bin_counts):
+                if rank < below + self.bin_counts[key]:
+                    targets.append((key, rank - below))
+                    break
+                below += self.bin_counts[key]
+        return targets
+
+    def median(self):
+        if not self.n:
+            return np.nan
+        values = np.array(sorted(self.values))
+        counts = np.array([self.values[value] for value in values])
+        keys = self._bins(values)
+        middle = []
+        for key, rank in self.targets:
+            in_bin = keys == key
+            middle.append(values[in_bin][np.searchsorted(np.cumsum(counts[in_bin]), rank, side='right')])
+        # As pandas: the mean of the two middle values for an even count
+        return middle[0] if len(middle) == 1 else (middle[0] + middle[1]) / 2
+
+
+def run_streaming(args, as_of):
+    """Three passes over the file, holding one chunk of rows at a time.
+
+    Pass 1 counts rows and missing values, bins every observed income and
+    fits the RFM scaler incrementally. Pass 2 keeps the incomes around the
+    middle rank to get the exact median, and, unless a saved model is
+    reused, fits MiniBatchKMeans on the scaled RFM features one batch at a
+    time. Pass 3 cleans, engineers features, segments and appends each chunk
+    to the output. Only the row hashes used to count duplicates grow with
+    the file, at 8 bytes per row.
+    """
+    model = saved_model(args)
+    fit = None
+    if model is None:
+        if args.algorithm != 'minibatch':
+            print("   • Streaming mode fits MiniBatchKMeans (--algorithm kmeans needs the whole matrix)")
+        fit = StreamingFit(args.k, batch_size=args.batch_size, sample_size=args.silhouette_sample)
+    income_median = StreamingMedian()
+
+    print(f"\n[1/6] Pass 1: collecting global statistics ({args.chunk_size:,} rows per chunk)")
+    missing = None
+    total_rows = 0
+    columns = None
+    for chunk in read_extract(args.input, args.chunk_size):
+        columns = list(chunk.columns)
+        total_rows += len(chunk)
+        chunk_missing = chunk.isnull().sum()
+        missing = chunk_missing if missing is None else missing + chunk_missing
+        income_median.count(chunk['Income'].to_numpy())
+        if fit is not None:
+            fit.scale(add_totals(valid_rows(chunk, as_of.year))[RFM_COLS].to_numpy(dtype='float64'))
+        print(f"   • Scanned {total_rows:,} records...", end='\r')
+    print(f"Scanned {total_rows} records with {len(columns)} columns" + " " * 20)
+
+    print("\n[2/6] Analyzing data structure...")
+    print(f"   - Shape: ({total_rows}, {len(columns)})")
+    print(f"   - Columns: {columns}")
+    print_missing(missing, total_rows)
+
+    print("\n[3/6] Pass 2: computing the income median" + (" and fitting RFM segmentation" if fit else ""))
+    if fit is not None:
+        chunks = read_extract(args.input, args.chunk_size)
+    else:
+        # Without a fit, only the Income column is read
+        chunks = pd.read_csv(args.input, chunksize=args.chunk_size,
+                             **{**READ_OPTIONS, 'usecols': ['Income'], 'parse_dates': None})
+    for chunk in chunks:
+        income_median.refine(chunk['Income'].to_numpy())
+        if fit is not None:
+            fit.cluster(add_totals(valid_rows(chunk, as_of.year))[RFM_COLS].to_numpy(dtype='float64'))
+    median_income = income_median.median()
+    print(f"Median Income for imputation: ${median_income:,.2f}")
+
+    print("\n[4/6] Fitting RFM segmentation")
+    if fit is not None:
+        model = save_segments(args, fit.model(income_median=float(median_income)))
+
+    print("\n[5/6] Pass 3: cleaning, engineering features and segmenting")
+    written = 0
+    total_features = 0
+    missing_values = 0
+    largest_chunk = 0
+    chunk_hashes = []
+    with CleanedWriter(args.output, args.format) as writer:
+        for chunk in read_extract(args.input, args.chunk_size):
+            chunk = clean_frame(chunk, median_income, as_of.year)
+            chunk = engineer_features(chunk, as_of)
+            chunk = assign_segments(chunk, model)
+            writer.write(chunk)
+            written += len(chunk)
+            total_features = len(chunk.columns)
+            missing_values += chunk.isnull().sum().sum()
+            largest_chunk = max(largest_chunk, memory_mb(chunk))
+            chunk_hashes.append(row_hashes(chunk))
+            print(f"   • Wrote {written:,} records...", end='\r')
+    print(f"   ✓ Wrote {written} records" + " " * 20)
+    print(f"   • Largest cleaned chunk: {largest_chunk:,.1f} MB in memory")
+
+    print("\n[6/6] Saved cleaned data")
+    print(f"Saved to {args.output} ({args.format})")
+
+    print_summary(written, total_features, missing_values, count_duplicates(np.concatenate(chunk_hashes)))
+
+
+def prepare_shard(path, staged_path, as_of, collect_rfm):
+    """Pass 1 of --shards, in a worker: clean one shard and engineer its
+    features, leaving Income missing until the global median is known."""
+    started = time.perf_counter()
+    df = read_extract(path)
+    summary = {
+        'rows': len(df),
+        'columns': list(df.columns),
+        'missing': df.isnull().sum(),
+        'incomes': df['Income'].dropna().to_numpy(),
+    }
+    df = engineer_features(clean_rows(df, as_of.year), as_of)
+    summary['rfm'] = df[RFM_COLS].to_numpy(dtype='float64') if collect_rfm else None
+    write_cleaned(df, staged_path, 'parquet')
+    summary['seconds'] = time.perf_counter() - started
+    return summary
+
+
+def finish_shard(staged_path, part_path, median_income, model):
+    """Pass 2 of --shards, in a worker: impute income and assign segments."""
+    df = impute_income(read_cleaned(staged_path), median_income)
+    df = assign_segments(df, model)
+    write_cleaned(df, part_path, 'parquet')
+    os.remove(staged_path)
+    return {
+        'rows': len(df),
+        'features': len(df.columns),
+        'missing_values': df.isnull().sum().sum(),
+        'memory_mb': memory_mb(df),
+        'hashes': row_hashes(df),
+    }
+
+
+def run_sharded(args, as_of):
+    """Cleans many extract files at once, one process per shard.
+
+    Pass 1 runs the per-row cleaning and feature steps of every shard in a
+    process pool and stages the results as Parquet. The global steps (income
+    median and segmentation model) then run once on what the workers
+    returned, and pass 2 imputes income and assigns segments in the pool,
+    writing one partition per shard. The dataset is built next to --output
+    and replaces it only when every partition has been written.
+    """
+    paths = sorted(glob.glob(args.shards))
+    if not paths:
+        raise SystemExit(f"No extract matches '{args.shards}'")
+    jobs = args.jobs or os.cpu_count()
+    building = args.output.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(building, ignore_errors=True)
+    staged = [os.path.join(building, f"_staged-{i:05d}.parquet") for i in range(len(paths))]
+    parts = [os.path.join(building, f"part-{i:05d}.parquet") for i in range(len(paths))]
+    model = saved_model(args)
+
+    print(f"\n[1/6] Pass 1: cleaning and engineering features of {len(paths)} shards with {jobs} processes")
+    started = time.perf_counter()
+    summaries = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for path, summary in zip(paths, pool.map(prepare_shard, paths, staged, [as_of] * len(paths),
+                                                 [model is None] * len(paths))):
+            summaries.append(summary)
+            print(f"   • {os.path.basename(path)}: {summary['rows']:,} records in {summary['seconds']:.2f}s")
+        total_rows = sum(summary['rows'] for summary in summaries)
+        elapsed = time.perf_counter() - started
+        print(f"   ✓ {total_rows:,} records in {elapsed:.2f}s ({total_rows / elapsed:,.0f} records/s)")
+
+        print("\n[2/6] Analyzing data structure...")
+        columns = summaries[0]['columns']
+        print(f"   - Shape: ({total_rows}, {len(columns)})")
+        print(f"   - Columns: {columns}")
+        print_missing(sum(summary['missing'] for summary in summaries), total_rows)
+
+        print("\n[3/6] Computing global statistics")
+        median_income = pd.Series(np.concatenate([summary.pop('incomes') for summary in summaries])).median()
+        print(f"Median Income for imputation: ${median_income:,.2f}")
+
+        print("\n[4/6] Fitting RFM segmentation")
+        if model is None:
+            model = fit_segments(args, np.concatenate([summary.pop('rfm') for summary in summaries]),
+                                 median_income)
+        del summaries
+
+        print("\n[5/6] Pass 2: imputing income, segmenting and writing partitions")
+        started = time.perf_counter()
+        results = list(pool.map(finish_shard, staged, parts, [median_income] * len(paths),
+                                [model] * len(paths)))
+        written = sum(result['rows'] for result in results)
+        print(f"   ✓ Wrote {written} records in {len(parts)} partitions in {time.perf_counter() - started:.2f}s")
+        print(f"   • Largest cleaned shard: {max(result['memory_mb'] for result in results):,.1f} MB in memory")
+
+    print("\n[6/6] Saved cleaned data")
+    if os.path.isdir(args.output):
+        shutil.rmtree(args.output)
+    elif os.path.exists(args.output):
+        os.remove(args.output)
+    os.replace(building, args.output)
+    print(f"Saved to {args.output} (partitioned parquet)")
+
+    print_summary(written, results[0]['features'], sum(result['missing_values'] for result in results),
+                  count_duplicates(np.concatenate([result['hashes'] for result in results])))
+
+
+def main():
+    args = parse_args()
+    if args.shards:
+        args.output = args.output or PARTITIONED_DATA_PATH
+    else:
+        args.output, args.format = resolve_output(args.output, args.format)
+    as_of = args.reference_date or reference_date()
+
+    print("=" * 60)
+    print("MARKETING CAMPAIGN DATA CLEANING SCRIPT")
+    print("=" * 60)
+    print(f"Features computed as of {as_of}")
+
+    if args.shards:
+        run_sharded(args, as_of)
+    elif args.chunk_size:
+        run_streaming(args, as_of)
+    else:
+        run_in_memory(args, as_of)
+
+
+if __name__ == '__main__':
+    main()
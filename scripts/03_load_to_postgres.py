@@ -1,14 +1,19 @@
+import argparse
+import io
+import time
+from datetime import datetime, timezone
+import numpy as np
 import pandas as pd
 import psycopg2
 from psycopg2 import sql
 import os
 from dotenv import load_dotenv
+from dataset_io import CLEANED_DATA_PATH, content_digest, read_cleaned
+from schema import log_memory
 
 load_dotenv('/app/backend/.env')
 
-print("=" * 60)
-print("LOADING DATA TO POSTGRESQL")
-print("=" * 60)
+SUMMARY_SQL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'sql', 'marketing_summary.sql')
 
 # Database connection parameters
 db_params = {
@@ -19,25 +24,25 @@ db_params = {
     'password': os.getenv('POSTGRES_PASSWORD', 'postgres')
 }
 
-print("\n[1/5] Connecting to PostgreSQL...")
-try:
-    conn = psycopg2.connect(**db_params)
-    conn.autocommit = True
-    cursor = conn.cursor()
-    print(f"   ✓ Connected to {db_params['database']}")
-except psycopg2.Error as e:
-    print(f"   ✗ Connection failed: {e}")
-    print("\n   Note: Ensure PostgreSQL is running with the following command:")
-    print("   sudo service postgresql start")
-    exit(1)
-
-# Create table
-print("\n[2/5] Creating marketing_campaigns table...")
-create_table_query = """
-DROP TABLE IF EXISTS marketing_campaigns;
+# Every load is built in SHADOW_SCHEMA while the API keeps reading the live
+# relations in public, then swapped in by moving schemas in one short
+# transaction. The relations it replaced are parked in PREVIOUS_SCHEMA and
+# dropped once the swap has committed.
+SHADOW_SCHEMA = 'marketing_load'
+PREVIOUS_SCHEMA = 'marketing_previous'
+LIVE_RELATIONS = ['marketing_campaigns', 'marketing_summary', 'cohort_monthly']
+SWAP_LOCK_TIMEOUT = os.getenv('LOAD_SWAP_LOCK_TIMEOUT', '5s')
+SWAP_ATTEMPTS = 5
+
+prepare_shadow_query = f"""
+DROP SCHEMA IF EXISTS {SHADOW_SCHEMA} CASCADE;
+CREATE SCHEMA {SHADOW_SCHEMA};
+SET search_path TO {SHADOW_SCHEMA};
+"""
 
+create_table_query = """
 CREATE TABLE marketing_campaigns (
-    id INTEGER PRIMARY KEY,
+    id INTEGER NOT NULL,
     year_birth INTEGER,
     education VARCHAR(50),
     marital_status VARCHAR(50),
@@ -77,26 +82,84 @@ CREATE TABLE marketing_campaigns (
     age_group VARCHAR(20),
     customer_segment INTEGER,
     customer_segment_label VARCHAR(50)
+) PARTITION BY RANGE (dt_customer);
+
+-- Rows outside the yearly partitions created for each load, and customers
+-- without an enrollment date, land here. A primary key on a partitioned table
+-- must include dt_customer and would make it NOT NULL, so the table has none;
+-- validate_shadow() checks that every id is unique instead.
+CREATE TABLE marketing_campaigns_default PARTITION OF marketing_campaigns DEFAULT;
+
+-- Monthly enrollment cohorts, rebuilt by refresh_cohorts() on every load
+CREATE TABLE cohort_monthly (
+    cohort_month DATE PRIMARY KEY,
+    customers INTEGER NOT NULL,
+    total_revenue DECIMAL(14,2),
+    total_clv DECIMAL(14,2),
+    avg_clv DECIMAL(10,2),
+    cmp1_acceptances INTEGER,
+    cmp2_acceptances INTEGER,
+    cmp3_acceptances INTEGER,
+    cmp4_acceptances INTEGER,
+    cmp5_acceptances INTEGER,
+    campaign_acceptances INTEGER,
+    responses INTEGER,
+    updated_at TIMESTAMP DEFAULT now()
 );
 """
 
-try:
-    cursor.execute(create_table_query)
-    print("   ✓ Table created successfully")
-except psycopg2.Error as e:
-    print(f"   ✗ Error creating table: {e}")
-    conn.close()
-    exit(1)
+# Support /api/customers keyset pagination: a (sort column, id) index per sort
+# order, plus (group, sort column, id) so a filtered page is still a single
+# index range scan rather than a walk past every non-matching customer.
+CUSTOMER_SORT_COLUMNS = ['clv', 'total_spent', 'recency']
+CUSTOMER_FILTER_COLUMNS = ['customer_segment_label', 'age_group', 'income_group']
+
+create_indexes_query = "".join(
+    ["CREATE INDEX idx_mc_id ON marketing_campaigns (id);\n"] +
+    [f"CREATE INDEX idx_mc_{sort}_id ON marketing_campaigns ({sort}, id);\n"
+     for sort in CUSTOMER_SORT_COLUMNS] +
+    [f"CREATE INDEX idx_mc_{group}_{sort}_id ON marketing_campaigns ({group}, {sort}, id);\n"
+     for group in CUSTOMER_FILTER_COLUMNS for sort in CUSTOMER_SORT_COLUMNS] +
+    # Filtered aggregate endpoints: single-group filters are served by the
+    # leading column above, these cover combined and enrollment-date filters.
+    ["CREATE INDEX idx_mc_segment_age_income ON marketing_campaigns "
+     "(customer_segment_label, age_group, income_group);\n",
+     "CREATE INDEX idx_mc_education_dt_customer ON marketing_campaigns (education, dt_customer);\n",
+     "CREATE INDEX idx_mc_dt_customer ON marketing_campaigns (dt_customer);\n"]
+) + "ANALYZE marketing_campaigns;\n"
 
-# Load cleaned data
-print("\n[3/5] Loading cleaned data...")
-df = pd.read_csv('/app/data/marketing_campaign_cleaned.csv')
-print(f"   ✓ Loaded {len(df)} records")
+# Every load builds into an empty shadow schema, so the rollup is always
+# recomputed in full from the freshly loaded table.
+refresh_cohorts_query = """
+DELETE FROM cohort_monthly;
 
-# Prepare data for insertion
-print("\n[4/5] Preparing data for insertion...")
-df.columns = df.columns.str.lower()
-df = df.rename(columns={
+INSERT INTO cohort_monthly (
+    cohort_month, customers, total_revenue, total_clv, avg_clv,
+    cmp1_acceptances, cmp2_acceptances, cmp3_acceptances, cmp4_acceptances, cmp5_acceptances,
+    campaign_acceptances, responses, updated_at
+)
+SELECT
+    date_trunc('month', dt_customer)::date,
+    COUNT(*),
+    SUM(total_spent),
+    SUM(clv),
+    ROUND(AVG(clv), 2),
+    SUM(accepted_cmp1),
+    SUM(accepted_cmp2),
+    SUM(accepted_cmp3),
+    SUM(accepted_cmp4),
+    SUM(accepted_cmp5),
+    SUM(total_campaigns_accepted),
+    SUM(response),
+    now()
+FROM marketing_campaigns
+WHERE dt_customer IS NOT NULL
+GROUP BY 1;
+"""
+
+column_renames = {
+    'mntwines': 'mnt_wines',
+    'mntfruits': 'mnt_fruits',
     'mntmeatproducts': 'mnt_meat_products',
     'mntfishproducts': 'mnt_fish_products',
     'mntsweetproducts': 'mnt_sweet_products',
@@ -121,47 +184,352 @@ df = df.rename(columns={
     'agegroup': 'age_group',
     'customersegment': 'customer_segment',
     'customersegmentlabel': 'customer_segment_label'
-})
+}
 
-# Replace NaN with None for SQL
-df = df.where(pd.notnull(df), None)
 
-# Insert data
-print("\n[5/5] Inserting data into PostgreSQL...")
-insert_query = """
-INSERT INTO marketing_campaigns VALUES (
-    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-)
-"""
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load the cleaned campaign data into PostgreSQL")
+    parser.add_argument('--input', default=CLEANED_DATA_PATH,
+                        help="Cleaned dataset produced by 01_data_cleaning.py")
+    parser.add_argument('--mode', choices=['copy', 'insert'], default='copy',
+                        help="'copy' streams rows through COPY FROM STDIN in one transaction, "
+                             "'insert' issues one INSERT per row")
+    parser.add_argument('--chunk-size', type=int, default=50000,
+                        help="Rows sent per COPY chunk (copy mode only)")
+    return parser.parse_args()
+
 
-try:
-    for idx, row in df.iterrows():
-        cursor.execute(insert_query, tuple(row))
+def format_rate(rows, elapsed):
+    rate = rows / elapsed if elapsed > 0 else float('inf')
+    return f"{elapsed:.2f}s, {rate:,.0f} rows/sec"
+
+
+def insert_rows(cursor, df):
+    """Row-at-a-time INSERT path: one round trip and one commit per record."""
+    insert_query = """
+    INSERT INTO marketing_campaigns VALUES (
+        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
+        %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+    )
+    """
+
+    started = time.perf_counter()
+    # Only each row is converted: NaN/NaT/NA are sent as NULL, and the NumPy
+    # scalars of nullable integer columns as Python ints
+    for idx, row in enumerate(df.itertuples(index=False, name=None)):
+        cursor.execute(insert_query, tuple(
+            None if pd.isna(value) else value.item() if isinstance(value, np.generic) else value
+            for value in row
+        ))
         if (idx + 1) % 100 == 0:
             print(f"   • Inserted {idx + 1}/{len(df)} records...", end='\r')
-    print(f"   ✓ Inserted all {len(df)} records successfully" + " " * 20)
-except psycopg2.Error as e:
-    print(f"\n   ✗ Error inserting data: {e}")
+    elapsed = time.perf_counter() - started
+    print(f"   ✓ Inserted all {len(df)} records ({format_rate(len(df), elapsed)})" + " " * 20)
+
+
+def copy_rows(cursor, df, chunk_size):
+    """Stream the frame through COPY FROM STDIN, one CSV buffer per chunk."""
+    copy_query = sql.SQL("COPY marketing_campaigns ({}) FROM STDIN WITH (FORMAT csv)").format(
+        sql.SQL(', ').join(sql.Identifier(col) for col in df.columns)
+    )
+
+    started = time.perf_counter()
+    copied = 0
+    for start in range(0, len(df), chunk_size):
+        chunk_started = time.perf_counter()
+        chunk = df.iloc[start:start + chunk_size]
+        buffer = io.StringIO()
+        chunk.to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+        cursor.copy_expert(copy_query, buffer)
+        copied += len(chunk)
+        chunk_elapsed = time.perf_counter() - chunk_started
+        print(f"   • Copied {copied:,}/{len(df):,} records "
+              f"(chunk: {format_rate(len(chunk), chunk_elapsed)})")
+    elapsed = time.perf_counter() - started
+    print(f"   ✓ Copied all {len(df):,} records ({format_rate(len(df), elapsed)})")
+
+
+def features_as_of(df):
+    """The reference date the cleaning stage computed ages and tenure as of:
+    every dated customer's enrollment date plus its tenure. None without dates."""
+    dates = (df['dt_customer'] + pd.to_timedelta(df['customer_tenure_days'], unit='D')).dropna().unique()
+    if len(dates) > 1:
+        raise ValueError(f"customers were cleaned as of {len(dates)} different dates")
+    return pd.Timestamp(dates[0]).date() if len(dates) else None
+
+
+def stamp_data_version(cursor, input_path, as_of):
+    """Record a new data version, which API response caches are keyed on, and
+    the reference date the API scores new customers as of."""
+    version = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{content_digest(input_path)[:12]}"
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pipeline_metadata (
+            key VARCHAR(50) PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT now()
+        );
+        INSERT INTO pipeline_metadata (key, value, updated_at)
+        VALUES ('data_version', %s, now())
+        ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value, updated_at = EXCLUDED.updated_at;
+        DELETE FROM pipeline_metadata WHERE key = 'reference_date';
+    """, (version,))
+    if as_of is not None:
+        cursor.execute("INSERT INTO pipeline_metadata (key, value) VALUES ('reference_date', %s);",
+                       (as_of.isoformat(),))
+    print(f"   ✓ Data version stamped: {version} (features as of {as_of})")
+
+
+def validate_shadow(cursor, expected_rows):
+    """Check the shadow relations account for every loaded row, once per id,
+    before swapping. Customers without an enrollment date have no cohort."""
+    cursor.execute("""
+        SELECT
+            (SELECT COUNT(*) FROM marketing_campaigns),
+            (SELECT customers FROM marketing_summary WHERE level = 'overall'),
+            (SELECT COALESCE(SUM(customers), 0) FROM cohort_monthly),
+            (SELECT COUNT(dt_customer) FROM marketing_campaigns),
+            (SELECT COUNT(*) - COUNT(DISTINCT id) FROM marketing_campaigns)
+    """)
+    *counts, dated_rows, duplicate_ids = cursor.fetchone()
+    counts = dict(zip(LIVE_RELATIONS, counts))
+    expected = {name: dated_rows if name == 'cohort_monthly' else expected_rows for name in LIVE_RELATIONS}
+    mismatched = {name: count for name, count in counts.items() if count != expected[name]}
+    if mismatched:
+        raise ValueError(f"expected {expected} customers, found {mismatched}")
+    if duplicate_ids:
+        raise ValueError(f"{duplicate_ids} customer id(s) appear more than once")
+    print(f"   ✓ Validated {expected_rows} customers in {', '.join(LIVE_RELATIONS)} "
+          f"({expected_rows - dated_rows} without an enrollment date)")
+
+
+def live_relations(cursor, schema):
+    """The API's tables, their partitions and the summary view within `schema`."""
+    cursor.execute("""
+        SELECT c.relname, c.relkind
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+        LEFT JOIN pg_class parent ON parent.oid = i.inhparent
+        WHERE n.nspname = %s
+          AND c.relkind IN ('r', 'p', 'm')
+          AND (c.relname = ANY(%s) OR parent.relname = ANY(%s))
+    """, (schema, LIVE_RELATIONS, LIVE_RELATIONS))
+    return cursor.fetchall()
+
+
+def move_relations(cursor, source, relations, target):
+    # Partitions do not follow their parent to a new schema, so each one is moved
+    for name, kind in relations:
+        cursor.execute(sql.SQL("ALTER {} {}.{} SET SCHEMA {}").format(
+            sql.SQL('MATERIALIZED VIEW' if kind == 'm' else 'TABLE'),
+            sql.Identifier(source), sql.Identifier(name), sql.Identifier(target)
+        ))
+
+
+def swap_in(conn, cursor, input_path, as_of):
+    """Replace the live relations with the shadow ones and stamp the new version atomically.
+
+    Moving schemas only touches the catalog, so the exclusive locks are held
+    for milliseconds. lock_timeout keeps a long-running reader from queueing
+    every new request behind the swap; the swap is retried instead.
+    """
+    for attempt in range(1, SWAP_ATTEMPTS + 1):
+        try:
+            started = time.perf_counter()
+            cursor.execute("SET LOCAL lock_timeout = %s", (SWAP_LOCK_TIMEOUT,))
+            cursor.execute(f"DROP SCHEMA IF EXISTS {PREVIOUS_SCHEMA} CASCADE; CREATE SCHEMA {PREVIOUS_SCHEMA};")
+            live = live_relations(cursor, 'public')
+            tables = [name for name, kind in live if name in LIVE_RELATIONS and kind != 'm']
+            if tables:
+                # Readers lock a parent table before its partitions. Taking the
+                # parents first (LOCK TABLE covers their partitions) follows the
+                # same order, so the swap cannot deadlock with a running query.
+                cursor.execute(sql.SQL("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE").format(
+                    sql.SQL(', ').join(sql.Identifier('public', name) for name in tables)
+                ))
+            move_relations(cursor, 'public', live, PREVIOUS_SCHEMA)
+            move_relations(cursor, SHADOW_SCHEMA, live_relations(cursor, SHADOW_SCHEMA), 'public')
+            cursor.execute("SET search_path TO public;")
+            stamp_data_version(cursor, input_path, as_of)
+            conn.commit()
+            print(f"   ✓ Swapped in new tables ({(time.perf_counter() - started) * 1000:.0f} ms)")
+            break
+        except psycopg2.errors.LockNotAvailable:
+            conn.rollback()
+            print(f"   • Tables busy, retrying swap ({attempt}/{SWAP_ATTEMPTS})")
+            time.sleep(attempt)
+    else:
+        raise RuntimeError(f"could not lock the live tables within {SWAP_LOCK_TIMEOUT} after {SWAP_ATTEMPTS} attempts")
+
+    cursor.execute(f"DROP SCHEMA {PREVIOUS_SCHEMA} CASCADE; DROP SCHEMA {SHADOW_SCHEMA} CASCADE;")
+    conn.commit()
+    print("   ✓ Previous tables dropped")
+
+
+def create_partitions(cursor, dates):
+    """One partition per enrollment year present in the data; with no dates
+    at all, every row goes to the default partition."""
+    dates = pd.to_datetime(dates).dropna()
+    if dates.empty:
+        print("   • No enrollment dates: default partition only")
+        return
+    for year in range(dates.min().year, dates.max().year + 1):
+        cursor.execute(sql.SQL(
+            "CREATE TABLE {} PARTITION OF marketing_campaigns FOR VALUES FROM (%s) TO (%s)"
+        ).format(sql.Identifier(f"marketing_campaigns_{year}")), (f"{year}-01-01", f"{year + 1}-01-01"))
+        print(f"   • Partition marketing_campaigns_{year}")
+
+
+def refresh_cohorts(cursor):
+    """Rebuild the monthly cohort rollup from marketing_campaigns."""
+    cursor.execute(refresh_cohorts_query)
+    cursor.execute("SELECT COUNT(*) FROM cohort_monthly;")
+    print(f"   ✓ cohort_monthly refreshed ({cursor.fetchone()[0]} months)")
+
+
+def create_indexes(cursor):
+    # Built after the bulk load so rows are not indexed one at a time
+    started = time.perf_counter()
+    cursor.execute(create_indexes_query)
+    print(f"   ✓ Indexes created ({time.perf_counter() - started:.2f}s)")
+
+
+def build_summary(cursor):
+    """Materialize the API aggregates (sql/marketing_summary.sql) over the new rows."""
+    with open(SUMMARY_SQL_PATH) as f:
+        summary_query = f.read()
+    cursor.execute("CREATE MATERIALIZED VIEW marketing_summary AS\n" + summary_query)
+    cursor.execute("SELECT level, COUNT(*) FROM marketing_summary GROUP BY level ORDER BY level;")
+    for level, groups in cursor.fetchall():
+        print(f"   • {level}: {groups} row(s)")
+    print("   ✓ marketing_summary rebuilt")
+
+
+def main():
+    args = parse_args()
+
+    print("=" * 60)
+    print("LOADING DATA TO POSTGRESQL")
+    print("=" * 60)
+
+    print("\n[1/7] Connecting to PostgreSQL...")
+    try:
+        conn = psycopg2.connect(**db_params)
+        # COPY mode runs the whole reload as one transaction; INSERT mode keeps
+        # the original autocommit-per-row behaviour for comparison.
+        conn.autocommit = args.mode == 'insert'
+        cursor = conn.cursor()
+        print(f"   ✓ Connected to {db_params['database']}")
+        # Session-level: released when this connection closes
+        cursor.execute("SELECT pg_try_advisory_lock(hashtext('03_load_to_postgres'));")
+        if not cursor.fetchone()[0]:
+            print("   ✗ Another load is already running")
+            exit(1)
+    except psycopg2.Error as e:
+        print(f"   ✗ Connection failed: {e}")
+        print("\n   Note: Ensure PostgreSQL is running with the following command:")
+        print("   sudo service postgresql start")
+        exit(1)
+
+    # Create tables in the shadow schema; the live ones stay readable
+    print(f"\n[2/7] Creating marketing_campaigns table in {SHADOW_SCHEMA}...")
+    try:
+        cursor.execute(prepare_shadow_query)
+        cursor.execute(create_table_query)
+        print("   ✓ Table created successfully")
+    except psycopg2.Error as e:
+        print(f"   ✗ Error creating table: {e}")
+        conn.close()
+        exit(1)
+
+    # Load cleaned data
+    print("\n[3/7] Loading cleaned data...")
+    df = read_cleaned(args.input)
+    print(f"   ✓ Loaded {len(df)} records")
+    log_memory(df, 'Cleaned frame')
+
+    # Prepare data for insertion
+    print("\n[4/7] Preparing data for insertion...")
+    # Relabel in place; rename() without inplace would copy every column
+    df.columns = df.columns.str.lower()
+    df.rename(columns=column_renames, inplace=True)
+    try:
+        as_of = features_as_of(df)
+    except ValueError as e:
+        print(f"   ✗ {e}")
+        conn.close()
+        exit(1)
+    print(f"   ✓ Features computed as of {as_of}")
+    try:
+        create_partitions(cursor, df['dt_customer'])
+    except psycopg2.Error as e:
+        print(f"   ✗ Error creating partitions: {e}")
+        conn.rollback()
+        conn.close()
+        exit(1)
+
+    # Insert data
+    print(f"\n[5/7] Inserting data into PostgreSQL ({args.mode} mode)...")
+    try:
+        if args.mode == 'copy':
+            copy_rows(cursor, df, args.chunk_size)
+        else:
+            insert_rows(cursor, df)
+    except psycopg2.Error as e:
+        print(f"\n   ✗ Error inserting data: {e}")
+        conn.rollback()
+        conn.close()
+        exit(1)
+
+    # Build the aggregates the API reads next to the new rows and check them
+    print("\n[6/7] Building indexes, summary and cohort aggregates...")
+    try:
+        create_indexes(cursor)
+        build_summary(cursor)
+        refresh_cohorts(cursor)
+        validate_shadow(cursor, len(df))
+        if not conn.autocommit:
+            conn.commit()
+    except (psycopg2.Error, OSError, ValueError) as e:
+        print(f"   ✗ Error building summary: {e}")
+        print("   The live tables were not modified")
+        conn.rollback()
+        conn.close()
+        exit(1)
+
+    # Data, summary and data version change together, so readers never see
+    # a missing table or rows and aggregates out of step.
+    print("\n[7/7] Swapping the new tables in...")
+    try:
+        conn.autocommit = False
+        swap_in(conn, cursor, args.input, as_of)
+    except (psycopg2.Error, OSError, RuntimeError) as e:
+        print(f"   ✗ Error swapping tables: {e}")
+        conn.rollback()
+        conn.close()
+        exit(1)
+
+    # Verify data
+    print("\n" + "=" * 60)
+    print("VERIFICATION")
+    print("=" * 60)
+    cursor.execute("SELECT COUNT(*) FROM marketing_campaigns;")
+    count = cursor.fetchone()[0]
+    print(f"\nTotal records in database: {count}")
+
+    cursor.execute("SELECT customer_segment_label, COUNT(*) FROM marketing_campaigns GROUP BY customer_segment_label;")
+    print("\nCustomer Segments:")
+    for row in cursor.fetchall():
+        print(f"  • {row[0]}: {row[1]} customers")
+
+    # Close connection
+    cursor.close()
     conn.close()
-    exit(1)
-
-# Verify data
-print("\n" + "=" * 60)
-print("VERIFICATION")
-print("=" * 60)
-cursor.execute("SELECT COUNT(*) FROM marketing_campaigns;")
-count = cursor.fetchone()[0]
-print(f"\nTotal records in database: {count}")
-
-cursor.execute("SELECT customer_segment_label, COUNT(*) FROM marketing_campaigns GROUP BY customer_segment_label;")
-print("\nCustomer Segments:")
-for row in cursor.fetchall():
-    print(f"  • {row[0]}: {row[1]} customers")
-
-# Close connection
-cursor.close()
-conn.close()
-
-print("\n✓ Data loaded to PostgreSQL successfully!")
-print("=" * 60)
\ No newline at end of file
+
+    print("\n✓ Data loaded to PostgreSQL successfully!")
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    main()
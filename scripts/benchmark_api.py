@@ -0,0 +1,129 @@
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+DASHBOARD_ENDPOINTS = [
+    '/api/kpis',
+    '/api/segments',
+    '/api/campaigns',
+    '/api/products',
+    '/api/channels',
+    '/api/demographics',
+    '/api/insights',
+]
+
+_local = threading.local()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Replay parallel dashboard load against the API and report throughput and latency")
+    parser.add_argument('--base-url', default='http://localhost:8001')
+    parser.add_argument('--concurrency', type=int, default=32,
+                        help="Number of simulated clients issuing requests in parallel")
+    parser.add_argument('--page-loads', type=int, default=100,
+                        help="Dashboard renders to simulate; each one requests every endpoint")
+    parser.add_argument('--endpoints', nargs='+', default=DASHBOARD_ENDPOINTS)
+    parser.add_argument('--save', help="Write the results as JSON, e.g. before.json")
+    parser.add_argument('--compare', help="Earlier results file to compare this run against")
+    return parser.parse_args()
+
+
+def fetch(url):
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _local.session = requests.Session()
+    started = time.perf_counter()
+    try:
+        ok = session.get(url, timeout=60).status_code == 200
+    except requests.RequestException:
+        ok = False
+    return url, time.perf_counter() - started, ok
+
+
+def summarize(latencies):
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        'requests': int(latencies_ms.size),
+        'p50_ms': round(float(np.percentile(latencies_ms, 50)), 2),
+        'p95_ms': round(float(np.percentile(latencies_ms, 95)), 2),
+        'p99_ms': round(float(np.percentile(latencies_ms, 99)), 2),
+    }
+
+
+def run(args):
+    urls = [args.base_url.rstrip('/') + endpoint for endpoint in args.endpoints] * args.page_loads
+
+    # Warm up connections and server-side caches before measuring
+    for url in urls[:len(args.endpoints)]:
+        fetch(url)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        samples = list(pool.map(fetch, urls))
+    elapsed = time.perf_counter() - started
+
+    results = {
+        'concurrency': args.concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'requests_per_sec': round(len(samples) / elapsed, 1),
+        'errors': sum(1 for _, _, ok in samples if not ok),
+        'overall': summarize([latency for _, latency, _ in samples]),
+        'endpoints': {},
+    }
+    for endpoint in args.endpoints:
+        url = args.base_url.rstrip('/') + endpoint
+        results['endpoints'][endpoint] = summarize([latency for u, latency, _ in samples if u == url])
+    return results
+
+
+def print_results(results, baseline=None):
+    def delta(current, previous):
+        if previous is None:
+            return ""
+        change = (current - previous) / previous * 100 if previous else 0
+        return f"  ({change:+.1f}% vs baseline {previous})"
+
+    overall = results['overall']
+    base_overall = baseline['overall'] if baseline else {}
+    print(f"\nRequests:       {overall['requests']} ({results['errors']} errors) "
+          f"at concurrency {results['concurrency']}")
+    print(f"Throughput:     {results['requests_per_sec']} req/s"
+          + delta(results['requests_per_sec'], baseline and baseline['requests_per_sec']))
+    for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+        print(f"Latency {key[:3]}:    {overall[key]} ms" + delta(overall[key], base_overall.get(key)))
+
+    print("\nPer endpoint p99:")
+    for endpoint, stats in results['endpoints'].items():
+        previous = baseline['endpoints'].get(endpoint, {}).get('p99_ms') if baseline else None
+        print(f"  • {endpoint:<20} {stats['p99_ms']:>8} ms" + delta(stats['p99_ms'], previous))
+
+
+def main():
+    args = parse_args()
+
+    print("=" * 60)
+    print("API CONCURRENCY BENCHMARK")
+    print("=" * 60)
+
+    results = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.save}")
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    main()
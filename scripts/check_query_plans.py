@@ -0,0 +1,63 @@
+import argparse
+import sys
+
+import requests
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Capture the plans of the API's named queries and report those that changed since the last capture")
+    parser.add_argument('--base-url', default='http://localhost:8001')
+    parser.add_argument('--query', nargs='+', help="Named queries to capture (default: all of them)")
+    parser.add_argument('--shapes', action='store_true', help="Print the old and new plan of each changed shape")
+    return parser.parse_args()
+
+
+def blocks(plan):
+    return plan['shared_hit_blocks'] + plan['shared_read_blocks'] + plan['temp_blocks']
+
+
+def print_plan(plan, show_shapes):
+    if 'error' in plan:
+        print(f"   ✗ {plan['query_name']}: {plan['error']}")
+        return
+    previous = plan.get('previous')
+    summary = f"{plan['execution_ms']:.1f} ms, {blocks(plan):,} buffers"
+    if previous:
+        summary += f" (was {previous['execution_ms']:.1f} ms, {blocks(previous):,} buffers)"
+    flags = [name for name, flagged in (('plan shape changed', plan['shape_changed']),
+                                         ('buffers changed', plan['buffers_changed'])) if flagged]
+    mark = '⚠' if flags else '✓' if previous else '•'
+    print(f"   {mark} {plan['query_name']}: {summary}" + (f" — {', '.join(flags)}" if flags else ''))
+    if flags and show_shapes and plan['shape_changed']:
+        print(f"     before (data version {previous['data_version']}):")
+        for line in previous['shape']:
+            print(f"       {line}")
+        print(f"     after (data version {plan['data_version']}):")
+        for line in plan['shape']:
+            print(f"       {line}")
+
+
+def main():
+    args = parse_args()
+
+    print("=" * 60)
+    print("QUERY PLAN CHECK")
+    print("=" * 60)
+
+    response = requests.post(f"{args.base_url.rstrip('/')}/api/diagnostics/plans",
+                             params={'query': args.query or []}, timeout=3600)
+    response.raise_for_status()
+    results = response.json()
+    for plan in results['plans']:
+        print_plan(plan, args.shapes)
+
+    print("\n" + "=" * 60)
+    print(f"{results['captured']} captured, {len(results['flagged'])} changed, {len(results['failed'])} failed")
+    print("=" * 60)
+    if results['flagged'] or results['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
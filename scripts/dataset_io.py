@@ -0,0 +1,149 @@
+"""Reading and writing the cleaned dataset handed between pipeline stages.
+
+The cleaning stage writes a typed columnar file (Parquet by default, or Arrow
+IPC) so that the downstream stages start without re-parsing text and keep
+categorical groups and dates intact. CSV is still available on request.
+"""
+import hashlib
+import os
+
+import pandas as pd
+
+from schema import CLEANED_DTYPES, DATE_COLUMNS, apply_schema, read_dtypes
+
+CLEANED_DATA_PATHS = {
+    'parquet': '/app/data/marketing_campaign_cleaned.parquet',
+    'arrow': '/app/data/marketing_campaign_cleaned.arrow',
+    'csv': '/app/data/marketing_campaign_cleaned.csv',
+}
+DEFAULT_FORMAT = 'parquet'
+CLEANED_DATA_PATH = CLEANED_DATA_PATHS[DEFAULT_FORMAT]
+# Written by 01_data_cleaning.py --shards: one Parquet file per extract shard
+PARTITIONED_DATA_PATH = '/app/data/marketing_campaign_cleaned'
+
+FORMAT_EXTENSIONS = {
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.ipc': 'arrow',
+    '.csv': 'csv',
+}
+
+
+def detect_format(path):
+    if os.path.isdir(path):
+        return 'parquet'
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMAT_EXTENSIONS:
+        raise ValueError(f"Cannot infer dataset format from '{path}'; "
+                         f"expected one of {sorted(FORMAT_EXTENSIONS)}")
+    return FORMAT_EXTENSIONS[extension]
+
+
+def resolve_output(path=None, fmt=None):
+    """Pick the output path and format from whichever of the two was given."""
+    if path is None:
+        fmt = fmt or DEFAULT_FORMAT
+        return CLEANED_DATA_PATHS[fmt], fmt
+    return path, fmt or detect_format(path)
+
+
+def read_cleaned(path, columns=None):
+    """Load the cleaned dataset with the column types of schema.CLEANED_DTYPES.
+
+    Columnar files are memory-mapped; files written before the schema existed
+    are cast on load.
+    """
+    fmt = detect_format(path)
+    if fmt == 'csv':
+        dates = [col for col in DATE_COLUMNS if columns is None or col in columns]
+        df = pd.read_csv(path, usecols=columns, dtype=read_dtypes(CLEANED_DTYPES, columns), parse_dates=dates)
+    elif fmt == 'parquet':
+        df = pd.read_parquet(path, columns=columns, memory_map=True)
+    else:
+        import pyarrow as pa
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+            if columns is not None:
+                table = table.select(columns)
+            df = table.to_pandas()
+    return apply_schema(df)
+
+
+def content_digest(path):
+    """sha256 of a dataset file, or of every file (and its relative path) under a directory."""
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    else:
+        files = [path]
+    for file_path in files:
+        if file_path != path:
+            digest.update(os.path.relpath(file_path, path).encode())
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def write_cleaned(df, path, fmt=None):
+    with CleanedWriter(path, fmt) as writer:
+        writer.write(df)
+
+
+class CleanedWriter:
+    """Appends frames chunk by chunk to a single Parquet, Arrow IPC or CSV file.
+
+    The schema of the first chunk is reused for every later chunk so that all
+    of them land in one typed file.
+    """
+
+    def __init__(self, path, fmt=None):
+        self.path = path
+        self.fmt = fmt or detect_format(path)
+        self.schema = None
+        self._writer = None
+        self._sink = None
+        self._header = True
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def write(self, df):
+        if self.fmt == 'csv':
+            df.to_csv(self.path, index=False, mode='w' if self._header else 'a', header=self._header)
+            self._header = False
+            return
+
+        import pyarrow as pa
+        if self._writer is None:
+            self.schema = self._file_schema(pa.Schema.from_pandas(df, preserve_index=False))
+            if self.fmt == 'parquet':
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(self.path, self.schema)
+            else:
+                self._sink = pa.OSFile(self.path, 'wb')
+                self._writer = pa.ipc.new_file(self._sink, self.schema)
+        self._writer.write_table(pa.Table.from_pandas(df, preserve_index=False).cast(self.schema))
+
+    def _file_schema(self, schema):
+        # An IPC file holds a single dictionary per column, so categoricals
+        # whose categories can differ between chunks are stored as strings
+        import pyarrow as pa
+        if self.fmt != 'arrow':
+            return schema
+        for index, field in enumerate(schema):
+            if pa.types.is_dictionary(field.type) and CLEANED_DTYPES.get(field.name) == 'category':
+                schema = schema.set(index, field.with_type(field.type.value_type))
+        return schema
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
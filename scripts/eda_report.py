@@ -0,0 +1,297 @@
+"""Exploratory analysis report of the cleaned dataset.
+
+build_report() computes every statistic that 02_exploratory_analysis.py
+prints in a handful of vectorized aggregations and returns them as a
+JSON-serializable dict. Reports are saved as `eda_report_<hash>.json`, keyed
+by the content hash of their input, and copied to `eda_report_latest.json`;
+a rerun on unchanged data only reads the saved JSON. Charts are drawn from
+the report itself, and the plotting libraries are imported only when charts
+are requested.
+"""
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+from features import CAMPAIGN_COLS, PURCHASE_COLS, SPENDING_COLS
+
+REPORT_DIR = os.getenv('EDA_REPORT_DIR', '/app/data/reports')
+LATEST_REPORT = 'eda_report_latest.json'
+VISUALIZATION_DIR = '/app/data/visualizations'
+
+# Bump when the contents of the report change, so saved reports are recomputed
+REPORT_VERSION = 1
+
+HIGH_SPENDER_THRESHOLD = 1000
+DESCRIBE_COLS = ['Age', 'Income']
+SEGMENT_COLS = ['Age', 'Income', 'TotalSpent', 'TotalPurchases', 'CLV']
+AGGREGATE_COLS = SPENDING_COLS + CAMPAIGN_COLS + PURCHASE_COLS + [
+    'Age', 'Income', 'TotalSpent', 'TotalPurchases', 'TotalCampaignsAccepted', 'CLV'
+]
+CATEGORY_COLS = ['Education', 'Marital_Status', 'CustomerSegmentLabel']
+REPORT_COLUMNS = AGGREGATE_COLS + CATEGORY_COLS
+
+
+def category_counts(values):
+    """value_counts of a categorical column from one bincount of its codes, largest first."""
+    values = values.astype('category')
+    codes = values.cat.codes.to_numpy()
+    counts = np.bincount(codes[codes >= 0], minlength=len(values.cat.categories))
+    order = np.argsort(-counts, kind='stable')
+    return {str(values.cat.categories[i]): int(counts[i]) for i in order if counts[i]}
+
+
+def describe(values):
+    """Series.describe() of a numeric column: NaN skipped, quartiles interpolated linearly."""
+    values = np.asarray(values, dtype='float64')
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {'count': 0.0}
+    q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+    return {
+        'count': float(len(values)),
+        'mean': float(values.mean()),
+        'std': float(values.std(ddof=1)) if len(values) > 1 else float('nan'),
+        'min': float(values.min()),
+        '25%': float(q1),
+        '50%': float(median),
+        '75%': float(q3),
+        'max': float(values.max()),
+    }
+
+
+def sum_and_mean(values):
+    """One reduction per column on its own dtype; integers are summed as int64."""
+    values = np.asarray(values)
+    if values.dtype.kind == 'f':
+        valid = ~np.isnan(values)
+        total, count = float(values.sum(where=valid)), int(valid.sum())
+    else:
+        total, count = int(values.sum(dtype='int64')), len(values)
+    return total, total / count if count else float('nan')
+
+
+def group_means(groups, columns):
+    """Mean of each column per observed category of `groups`, from weighted bincounts."""
+    codes = groups.cat.codes.to_numpy()
+    size = len(groups.cat.categories)
+    means = {}
+    for col, values in columns.items():
+        values = np.asarray(values, dtype='float64')
+        valid = (codes >= 0) & ~np.isnan(values)
+        counts = np.bincount(codes[valid], minlength=size)
+        sums = np.bincount(codes[valid], weights=values[valid], minlength=size)
+        for i in np.flatnonzero(counts):
+            means.setdefault(str(groups.cat.categories[i]), {})[col] = float(sums[i] / counts[i])
+    return means
+
+
+def build_report(df):
+    """Every statistic of the report, with one NumPy reduction (or bincount) per column."""
+    rows = len(df)
+    totals = {col: sum_and_mean(df[col].to_numpy()) for col in AGGREGATE_COLS}
+    sums = {col: total for col, (total, _) in totals.items()}
+    means = {col: mean for col, (_, mean) in totals.items()}
+    # Customers by number of campaigns accepted: [0] is those who never responded
+    accepted = np.bincount(df['TotalCampaignsAccepted'].to_numpy(), minlength=1)
+    high_spenders = int(np.count_nonzero(df['TotalSpent'].to_numpy() > HIGH_SPENDER_THRESHOLD))
+    segments = df['CustomerSegmentLabel'].astype('category')
+
+    demographics = {col.lower(): describe(df[col].to_numpy()) for col in DESCRIBE_COLS}
+    demographics['education'] = category_counts(df['Education'])
+    demographics['marital_status'] = category_counts(df['Marital_Status'])
+    channel_totals = {col.replace('Num', '').replace('Purchases', ''): int(sums[col]) for col in PURCHASE_COLS}
+    all_purchases = sum(channel_totals.values())
+    return {
+        'rows': rows,
+        'demographics': demographics,
+        'spending': {
+            'average_by_category': {col.replace('Mnt', ''): float(means[col]) for col in SPENDING_COLS},
+            'average_total': float(means['TotalSpent']),
+            'median_total': float(np.median(df['TotalSpent'].to_numpy())),
+            'average_clv': float(means['CLV']),
+            'high_spenders': {
+                'threshold': HIGH_SPENDER_THRESHOLD,
+                'customers': high_spenders,
+                'share': high_spenders / rows if rows else 0.0,
+            },
+        },
+        'campaigns': {
+            'acceptance_rates': {col: float(means[col]) for col in CAMPAIGN_COLS},
+            'acceptances': {col: int(sums[col]) for col in CAMPAIGN_COLS},
+            # First campaign with the most acceptances, as idxmax picks
+            'best_campaign': max(CAMPAIGN_COLS, key=lambda col: sums[col]),
+            'response_rate': (rows - int(accepted[0])) / rows if rows else 0.0,
+            'average_accepted': float(means['TotalCampaignsAccepted']),
+            'never_responded': int(accepted[0]),
+            'customers_by_accepted': {str(k): int(count) for k, count in enumerate(accepted)},
+        },
+        'channels': {
+            'average_purchases': {
+                col.replace('Num', '').replace('Purchases', ''): float(means[col]) for col in PURCHASE_COLS
+            },
+            'total_purchases': channel_totals,
+            'share': {
+                channel: total / all_purchases if all_purchases else 0.0
+                for channel, total in channel_totals.items()
+            },
+        },
+        'segments': {
+            'customers': category_counts(segments),
+            'averages': group_means(segments, {col: df[col].to_numpy() for col in SEGMENT_COLS}),
+        },
+    }
+
+
+def report_path(report_dir, digest):
+    return os.path.join(report_dir, f"eda_report_{digest[:16]}.json")
+
+
+def load_report(report_dir, digest):
+    """The saved report for this input hash; None if there is none or it is outdated."""
+    path = report_path(report_dir, digest)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        report = json.load(f)
+    if report.get('report_version') != REPORT_VERSION or report.get('input_sha256') != digest:
+        return None
+    return report
+
+
+def save_report(report, report_dir=REPORT_DIR):
+    os.makedirs(report_dir, exist_ok=True)
+    payload = json.dumps(report, indent=2)
+    path = report_path(report_dir, report['input_sha256'])
+    # A run interrupted mid-write would leave a truncated report that
+    # load_report and the pipeline cache then trip over; write beside the
+    # target and rename over it.
+    for target in (path, os.path.join(report_dir, LATEST_REPORT)):
+        partial = target + '.tmp'
+        with open(partial, 'w') as f:
+            f.write(payload)
+        os.replace(partial, target)
+    return path
+
+
+def new_report(df, input_path, digest):
+    return {
+        'report_version': REPORT_VERSION,
+        'input': os.path.abspath(input_path),
+        'input_sha256': digest,
+        'generated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        **build_report(df),
+    }
+
+
+def print_table(values, fmt='{}'):
+    width = max((len(key) for key in values), default=0)
+    for key, value in values.items():
+        print(f"{key:<{width}}  {fmt.format(value)}")
+
+
+def print_report(report):
+    demographics = report['demographics']
+    spending = report['spending']
+    campaigns = report['campaigns']
+    channels = report['channels']
+    segments = report['segments']
+
+    print("\nAge Distribution:")
+    print_table(demographics['age'], '{:,.2f}')
+    print("\nIncome Distribution:")
+    print_table(demographics['income'], '{:,.2f}')
+    print("\nEducation Distribution:")
+    print_table(demographics['education'])
+    print("\nMarital Status Distribution:")
+    print_table(demographics['marital_status'])
+
+    print("\nAverage Spending by Category:")
+    for category, mean in spending['average_by_category'].items():
+        print(f"  • {category}: ${mean:,.2f}")
+    print(f"\nTotal Average Spending: ${spending['average_total']:,.2f}")
+    print(f"Total Median Spending: ${spending['median_total']:,.2f}")
+
+    print("\nCampaign Acceptance Rates:")
+    for campaign, rate in campaigns['acceptance_rates'].items():
+        print(f"  • {campaign}: {rate * 100:.2f}%")
+    print(f"\nOverall Response Rate: {campaigns['response_rate'] * 100:.2f}%")
+
+    print("\nAverage Purchases by Channel:")
+    for channel, mean in channels['average_purchases'].items():
+        print(f"  • {channel}: {mean:.2f}")
+
+    print("\n" + "=" * 60)
+    print("CUSTOMER SEGMENTATION ANALYSIS")
+    print("=" * 60)
+    print("\nSegment Distribution:")
+    print_table(segments['customers'])
+    print("\nSegment Characteristics:")
+    width = max((len(label) for label in segments['averages']), default=0)
+    print(f"{'':<{width}}" + ''.join(f"{col:>16}" for col in SEGMENT_COLS))
+    for label, values in segments['averages'].items():
+        print(f"{label:<{width}}" + ''.join(f"{values[col]:>16,.2f}" for col in SEGMENT_COLS))
+
+    top_category, top_mean = max(spending['average_by_category'].items(), key=lambda item: item[1])
+    high_spenders = spending['high_spenders']
+    print("\n" + "=" * 60)
+    print("KEY INSIGHTS")
+    print("=" * 60)
+    print(f"\n1. Customer Base:")
+    print(f"   • Average Age: {demographics['age']['mean']:.0f} years")
+    print(f"   • Average Income: ${demographics['income']['mean']:,.2f}")
+    print(f"   • Most Common Education: {next(iter(demographics['education']), 'n/a')}")
+
+    print(f"\n2. Spending Behavior:")
+    print(f"   • Top Spending Category: {top_category} (${top_mean:,.2f})")
+    print(f"   • Average CLV: ${spending['average_clv']:,.2f}")
+    print(f"   • High Spenders (>${high_spenders['threshold']:,}): {high_spenders['customers']} "
+          f"({high_spenders['share'] * 100:.1f}%)")
+
+    print(f"\n3. Campaign Effectiveness:")
+    print(f"   • Best Campaign: Campaign {campaigns['best_campaign'][-1]}")
+    print(f"   • Average Campaigns Accepted: {campaigns['average_accepted']:.2f}")
+    print(f"   • Never Responded: {campaigns['never_responded']} customers")
+
+    print(f"\n4. Purchase Channels:")
+    for channel in ['Store', 'Web', 'Catalog']:
+        print(f"   • {channel}: {channels['share'][channel] * 100:.1f}%")
+
+
+def plot_report(report, out_dir=VISUALIZATION_DIR):
+    """Overview charts of the report's aggregates, saved as one PNG."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    plt.style.use('seaborn-v0_8-darkgrid')
+    sns.set_palette('husl')
+
+    segments = report['segments']
+    charts = [
+        ('Customers by Education', report['demographics']['education'], 'Customers'),
+        ('Average Spending by Category', report['spending']['average_by_category'], 'Amount ($)'),
+        ('Campaign Acceptance Rate',
+         {col.replace('Accepted', ''): rate * 100 for col, rate in report['campaigns']['acceptance_rates'].items()},
+         'Customers (%)'),
+        ('Purchases by Channel', report['channels']['total_purchases'], 'Purchases'),
+        ('Customers by Segment', segments['customers'], 'Customers'),
+        ('Average CLV by Segment', {label: values['CLV'] for label, values in segments['averages'].items()},
+         'CLV ($)'),
+    ]
+    fig, axes = plt.subplots(2, 3, figsize=(18, 10))
+    for ax, (title, values, ylabel) in zip(axes.flat, charts):
+        ax.bar(list(values), list(values.values()), color=sns.color_palette('husl', len(values)))
+        ax.set_title(title)
+        ax.set_ylabel(ylabel)
+        ax.tick_params(axis='x', rotation=30)
+    fig.suptitle(f"Marketing Campaign EDA ({report['rows']:,} customers)")
+    fig.tight_layout()
+
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, 'eda_overview.png')
+    fig.savefig(path, dpi=120)
+    plt.close(fig)
+    return path
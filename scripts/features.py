@@ -0,0 +1,82 @@
+"""Feature definitions shared by the cleaning stage, the ETL and the scoring API.
+
+Every function works on whole columns at once (NumPy arrays or pandas
+Series); there are no per-row Python functions. Date-dependent features
+(age, tenure, CLV) are computed as of one reference date, resolved once per
+run by `reference_date()`, so that every feature of a run agrees on "today".
+"""
+import os
+from datetime import date
+
+import numpy as np
+
+REFERENCE_DATE_ENV = 'FEATURE_REFERENCE_DATE'
+
+SPENDING_COLS = ['MntWines', 'MntFruits', 'MntMeatProducts', 'MntFishProducts', 'MntSweetProducts', 'MntGoldProds']
+PURCHASE_COLS = ['NumWebPurchases', 'NumCatalogPurchases', 'NumStorePurchases']
+CAMPAIGN_COLS = ['AcceptedCmp1', 'AcceptedCmp2', 'AcceptedCmp3', 'AcceptedCmp4', 'AcceptedCmp5']
+
+# Cleaned dataset and API groups: right-closed, like pd.cut
+INCOME_BINS = [0, 30000, 50000, 75000, 100000, float('inf')]
+INCOME_LABELS = ['Low', 'Lower-Mid', 'Mid', 'Upper-Mid', 'High']
+AGE_BINS = [0, 30, 40, 50, 60, float('inf')]
+AGE_LABELS = ['<30', '30-40', '40-50', '50-60', '60+']
+
+# analytics.customers brackets written by etl_campaign.py: left-closed
+BRACKET_AGE_BINS = [-float('inf'), 25, 36, 51, 66, float('inf')]
+BRACKET_AGE_LABELS = ['<25', '25-35', '36-50', '51-65', '65+']
+BRACKET_INCOME_BINS = [-float('inf'), 40000, 70000, 100000, float('inf')]
+BRACKET_INCOME_LABELS = ['Low', 'Medium', 'High', 'Very High']
+
+
+def reference_date(value=None):
+    """`value` (YYYY-MM-DD), else $FEATURE_REFERENCE_DATE, else today."""
+    value = value or os.getenv(REFERENCE_DATE_ENV)
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value) if value else date.today()
+
+
+def bucket(values, bins, labels, right=True):
+    """Vectorized pd.cut: None outside the edges or for NaN.
+
+    Bins are right-closed, (a, b], by default and left-closed, [a, b), with
+    `right=False`.
+    """
+    values = np.asarray(values, dtype='float64')
+    codes = np.searchsorted(bins, values, side='left' if right else 'right') - 1
+    valid = (codes >= 0) & (codes < len(labels)) & ~np.isnan(values)
+    names = np.asarray(labels, dtype=object)
+    return np.where(valid, names[np.clip(codes, 0, len(labels) - 1)], None)
+
+
+def age(year_birth, as_of):
+    return as_of.year - np.asarray(year_birth)
+
+
+def tenure_days(joined, as_of):
+    """Whole days from each join date to `as_of`; NaN for missing dates."""
+    joined = np.asarray(joined, dtype='datetime64[D]')
+    days = (np.datetime64(as_of, 'D') - joined).astype('int64')
+    missing = np.isnat(joined)
+    return np.where(missing, np.nan, days) if missing.any() else days
+
+
+def responded(values):
+    """True where the response flag is 1; missing or unparseable flags are False."""
+    return np.asarray(values, dtype='float64') == 1
+
+
+def add_totals(df):
+    df['TotalSpent'] = df[SPENDING_COLS].sum(axis=1)
+    df['TotalPurchases'] = df[PURCHASE_COLS].sum(axis=1)
+    return df
+
+
+def clv(total_spent, tenure_days):
+    """Spend per year of tenure; customers without tenure get 0."""
+    total_spent = np.asarray(total_spent, dtype='float64')
+    years = np.asarray(tenure_days, dtype='float64') / 365.25
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = total_spent / years
+    return np.where(np.isinf(values), 0.0, values)
@@ -0,0 +1,301 @@
+"""Runs the pipeline stages, skipping those whose inputs and code are unchanged.
+
+Each stage declares its script, arguments, the source files it runs, the
+files it reads and the files it writes. Its fingerprint is a hash of all of
+them (file contents, not timestamps). A stage runs again only when its
+fingerprint differs from the last successful run, when an output is missing,
+or when it is forced. Stages whose dependencies have finished run
+concurrently, each in its own process with its output in a log file; the
+wall time and peak RSS of every stage are recorded in the state file.
+
+Content hashes are cached by file size and modification time, so an
+unchanged rerun does not read the data files at all.
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from dataset_io import CLEANED_DATA_PATH, content_digest
+from eda_report import LATEST_REPORT, REPORT_DIR
+from features import REFERENCE_DATE_ENV, reference_date
+from segmentation import LATEST_MODEL, MODEL_DIR
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SQL_DIR = os.path.join(SCRIPTS_DIR, '..', 'sql')
+
+RAW_DATA_PATH = '/app/marketing_campaign.csv'
+STATE_PATH = '/app/data/pipeline_state.json'
+LOG_DIR = '/app/data/logs'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the cleaning, EDA and load stages, skipping unchanged ones")
+    parser.add_argument('--raw', default=RAW_DATA_PATH, help="Raw campaign extract")
+    parser.add_argument('--cleaned', default=CLEANED_DATA_PATH, help="Cleaned dataset written by the clean stage")
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--report-dir', default=REPORT_DIR)
+    parser.add_argument('--reference-date', type=reference_date,
+                        help=f"Passed to the clean stage (default: ${REFERENCE_DATE_ENV}, else the date of "
+                             f"the last successful clean in --state, else today); a new date changes its "
+                             f"fingerprint")
+    parser.add_argument('--state', default=STATE_PATH, help="Fingerprints and timings of past runs")
+    parser.add_argument('--log-dir', default=LOG_DIR, help="Where each stage's output is written")
+    parser.add_argument('--force', nargs='*', metavar='STAGE',
+                        help="Run these stages (all of them if none are named) even if unchanged")
+    parser.add_argument('--only', nargs='+', metavar='STAGE', help="Run only these stages")
+    parser.add_argument('--jobs', type=int, default=2, help="Stages run at the same time")
+    parser.add_argument('--dry-run', action='store_true', help="Show which stages would run")
+    return parser.parse_args()
+
+
+def declare_stages(args):
+    model = os.path.join(args.model_dir, LATEST_MODEL)
+    report = os.path.join(args.report_dir, LATEST_REPORT)
+    return [
+        {
+            'name': 'clean',
+            'script': '01_data_cleaning.py',
+            'args': ['--input', args.raw, '--output', args.cleaned, '--model-dir', args.model_dir,
+                     '--reference-date', args.reference_date.isoformat()],
+            'code': ['01_data_cleaning.py', 'dataset_io.py', 'features.py', 'schema.py', 'segmentation.py'],
+            # The saved model is reused when present and written when not
+            'inputs': [args.raw, model],
+            'outputs': [args.cleaned, model],
+            'after': [],
+        },
+        {
+            'name': 'eda',
+            'script': '02_exploratory_analysis.py',
+            'args': [args.cleaned, '--report-dir', args.report_dir],
+            'code': ['02_exploratory_analysis.py', 'eda_report.py', 'dataset_io.py', 'features.py', 'schema.py'],
+            'inputs': [args.cleaned],
+            'outputs': [report],
+            'after': ['clean'],
+        },
+        {
+            'name': 'load',
+            'script': '03_load_to_postgres.py',
+            'args': ['--input', args.cleaned],
+            'code': ['03_load_to_postgres.py', 'dataset_io.py', 'features.py', 'schema.py',
+                     os.path.join(SQL_DIR, 'marketing_summary.sql')],
+            # Writes to PostgreSQL, which is not tracked; --force load after changing the database
+            'inputs': [args.cleaned],
+            'outputs': [],
+            'after': ['clean'],
+        },
+    ]
+
+
+def signature(path):
+    """Size and mtime of a file, or of every file under a directory."""
+    if os.path.isdir(path):
+        return sorted(
+            [os.path.relpath(os.path.join(root, name), path), *signature(os.path.join(root, name))]
+            for root, _, names in os.walk(path) for name in names
+        )
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def cached_digest(path, digests):
+    """content_digest, reused from `digests` while the file's signature is unchanged."""
+    if not os.path.exists(path):
+        return None
+    path = os.path.abspath(path)
+    current = signature(path)
+    entry = digests.get(path)
+    if entry is None or entry['signature'] != current:
+        entry = {'signature': current, 'sha256': content_digest(path)}
+        digests[path] = entry
+    return entry['sha256']
+
+
+def describe_stage(stage, digests):
+    code_path = lambda name: name if os.path.isabs(name) else os.path.join(SCRIPTS_DIR, name)
+    parts = {
+        'args': stage['args'],
+        'code': {name: cached_digest(code_path(name), digests) for name in stage['code']},
+        'inputs': {path: cached_digest(path, digests) for path in stage['inputs']},
+    }
+    parts['fingerprint'] = hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+    return parts
+
+
+def run_reason(stage, parts, previous, forced):
+    """Why the stage has to run, or None if it can be skipped."""
+    if forced:
+        return 'forced'
+    if previous is None:
+        return 'no previous run'
+    missing = [path for path in stage['outputs'] if not os.path.exists(path)]
+    if missing:
+        return f"missing {', '.join(missing)}"
+    if previous['fingerprint'] == parts['fingerprint']:
+        return None
+    changed = [
+        f"{kind} {name}"
+        for kind in ('code', 'inputs')
+        for name, digest in parts[kind].items()
+        if previous.get(kind, {}).get(name) != digest
+    ]
+    if previous.get('args') != parts['args']:
+        changed.append('arguments')
+    return 'changed: ' + ', '.join(changed or ['fingerprint'])
+
+
+def load_state(path):
+    if not os.path.exists(path):
+        return {'digests': {}, 'stages': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    partial = path + '.tmp'
+    with open(partial, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(partial, path)
+
+
+def start_stage(stage, log_dir):
+    os.makedirs(log_dir, exist_ok=True)
+    log_path = os.path.join(log_dir, f"{stage['name']}.log")
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(SCRIPTS_DIR, stage['script']), *stage['args']],
+            cwd=SCRIPTS_DIR, stdout=log, stderr=subprocess.STDOUT,
+        )
+    return process, log_path
+
+
+def print_log_tail(log_path, lines=20):
+    with open(log_path, errors='replace') as f:
+        for line in f.readlines()[-lines:]:
+            print(f"     | {line.rstrip()}")
+
+
+def run(args):
+    stages = declare_stages(args)
+    names = [stage['name'] for stage in stages]
+    for name in (args.force or []) + (args.only or []):
+        if name not in names:
+            raise SystemExit(f"Unknown stage '{name}' (stages: {', '.join(names)})")
+    forced = set(names if args.force == [] else args.force or [])
+    selected = set(args.only or names)
+
+    state = load_state(args.state)
+    status = {}  # name -> 'ran', 'skipped', 'failed' or 'blocked'
+    pending = [stage for stage in stages if stage['name'] in selected]
+    running = {}  # pid -> (stage, process, parts, started, log_path)
+    started_all = time.perf_counter()
+
+    while pending or running:
+        for stage in list(pending):
+            if len(running) >= args.jobs:
+                break
+            after = [name for name in stage['after'] if name in selected]
+            if any(status.get(name) in ('failed', 'blocked') for name in after):
+                pending.remove(stage)
+                status[stage['name']] = 'blocked'
+                print(f"   - {stage['name']}: not run, a dependency failed")
+                continue
+            if not all(name in status for name in after):
+                continue
+            pending.remove(stage)
+
+            # Fingerprinted now, after its dependencies have written their outputs
+            if args.dry_run and any(status.get(name) == 'ran' for name in after):
+                print(f"   ▶ {stage['name']}: would run if its inputs change")
+                status[stage['name']] = 'ran'
+                continue
+            parts = describe_stage(stage, state['digests'])
+            reason = run_reason(stage, parts, state['stages'].get(stage['name']), stage['name'] in forced)
+            if reason is None:
+                status[stage['name']] = 'skipped'
+                print(f"   ✓ {stage['name']}: unchanged ({parts['fingerprint'][:12]}), skipped")
+                continue
+            if args.dry_run:
+                status[stage['name']] = 'ran'
+                print(f"   ▶ {stage['name']}: would run ({reason})")
+                continue
+            process, log_path = start_stage(stage, args.log_dir)
+            running[process.pid] = (stage, process, parts, time.perf_counter(), log_path)
+            print(f"   ▶ {stage['name']}: started ({reason}), log {log_path}")
+
+        if not running:
+            if pending and not any(all(name in status for name in stage['after'] if name in selected)
+                                   for stage in pending):
+                raise RuntimeError(f"Stages {[stage['name'] for stage in pending]} can never start")
+            continue
+        # wait4 reaps whichever stage finishes first and reports its own peak RSS
+        pid, wait_status, usage = os.wait4(-1, 0)
+        if pid not in running:
+            continue
+        stage, process, parts, started, log_path = running.pop(pid)
+        process.returncode = exit_code = os.waitstatus_to_exitcode(wait_status)
+        elapsed = time.perf_counter() - started
+        peak_mb = usage.ru_maxrss / 1024
+        if exit_code != 0:
+            status[stage['name']] = 'failed'
+            print(f"   ✗ {stage['name']}: failed with exit code {exit_code} after {elapsed:.1f}s")
+            print_log_tail(log_path)
+            continue
+
+        status[stage['name']] = 'ran'
+        if stage['name'] == 'clean':
+            state['reference_date'] = args.reference_date.isoformat()
+        # The outputs were just written, so the digests of the inputs that are
+        # also outputs (the model) are taken again
+        parts = describe_stage(stage, state['digests'])
+        state['stages'][stage['name']] = {
+            **parts,
+            'finished_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'wall_seconds': round(elapsed, 3),
+            'peak_rss_mb': round(peak_mb, 1),
+        }
+        save_state(state, args.state)
+        print(f"   ✓ {stage['name']}: finished in {elapsed:.1f}s, peak RSS {peak_mb:,.0f} MB")
+
+    if not args.dry_run:
+        save_state(state, args.state)
+    return status, time.perf_counter() - started_all
+
+
+def main():
+    args = parse_args()
+    # Stages run from the scripts directory
+    for option in ('raw', 'cleaned', 'model_dir', 'report_dir', 'state', 'log_dir'):
+        setattr(args, option, os.path.abspath(getattr(args, option)))
+    # Pinned to the date the current cleaned dataset was computed as of, so an
+    # unchanged extract is not re-cleaned just because the day changed
+    args.reference_date = args.reference_date or reference_date(
+        os.getenv(REFERENCE_DATE_ENV) or load_state(args.state).get('reference_date'))
+
+    print("=" * 60)
+    print("MARKETING CAMPAIGN PIPELINE")
+    print("=" * 60)
+    print(f"Raw extract: {args.raw}")
+    print(f"Cleaned dataset: {args.cleaned}")
+    print(f"Reference date: {args.reference_date}\n")
+
+    status, elapsed = run(args)
+
+    print("\n" + "=" * 60)
+    counts = {kind: sum(1 for value in status.values() if value == kind)
+              for kind in ('ran', 'skipped', 'failed', 'blocked')}
+    verb = 'would run' if args.dry_run else 'ran'
+    print(f"{counts['ran']} {verb}, {counts['skipped']} skipped, {counts['failed']} failed, "
+          f"{counts['blocked']} not run in {elapsed:.1f}s")
+    print("=" * 60)
+    if counts['failed'] or counts['blocked']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Column types of the raw campaign extract and of the cleaned dataset.
+
+Every stage reads with these types instead of pandas' defaults, which give an
+int64 for every count and flag and a Python string object for every category
+value. Integers are downcast to the narrowest width that leaves headroom over
+the observed ranges. Text columns become categoricals, and the groups written
+by the cleaning stage have fixed categories so that every chunk of a streamed
+file shares one dictionary. Education keeps whatever levels the extract has,
+so a new level passes through instead of failing the run.
+
+The integer columns of the extract are read as pandas' nullable integers, so a
+blank value is NA instead of failing the read or turning the column into
+float64. read_csv parses a nullable integer column several times slower than a
+float one, so they are read as float64 (RAW_READ_DTYPES) and converted by
+nullable_integers. The cleaning stage drops the rows with a blank birth year or count,
+and the cleaned dataset has the plain NumPy widths of INTEGER_DTYPES. ID is
+the key and stays non-nullable. Income stays float64, and its missing values
+are NaN until the cleaning stage imputes them. CustomerTenureDays is a
+nullable Int32, missing where Dt_Customer is.
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+from features import AGE_LABELS, CAMPAIGN_COLS, INCOME_LABELS, PURCHASE_COLS, SPENDING_COLS
+
+MARITAL_STATUSES = ['Divorced', 'Married', 'Other', 'Single', 'Widowed']
+
+DATE_COLUMNS = ['Dt_Customer']
+
+# Integer columns of the extract other than ID, at their cleaned width
+INTEGER_DTYPES = {
+    'Year_Birth': 'int16',
+    'Kidhome': 'int8',
+    'Teenhome': 'int8',
+    'Recency': 'int16',
+    **{col: 'int32' for col in SPENDING_COLS},
+    'NumDealsPurchases': 'int16',
+    **{col: 'int16' for col in PURCHASE_COLS},
+    'NumWebVisitsMonth': 'int16',
+    **{col: 'int8' for col in CAMPAIGN_COLS},
+    'Complain': 'int8',
+    'Z_CostContact': 'int16',
+    'Z_Revenue': 'int16',
+    'Response': 'int8',
+}
+
+RAW_DTYPES = {
+    'ID': 'int32',
+    'Education': 'category',
+    'Marital_Status': 'category',
+    'Income': 'float64',
+    # 'int16' -> 'Int16': the nullable type of the same width
+    **{col: dtype.capitalize() for col, dtype in INTEGER_DTYPES.items()},
+}
+
+# What read_csv is given for the extract; nullable_integers() finishes the job
+RAW_READ_DTYPES = {**RAW_DTYPES, **{col: 'float64' for col in INTEGER_DTYPES}}
+
+CLEANED_DTYPES = {
+    **RAW_DTYPES,
+    **INTEGER_DTYPES,
+    'Marital_Status': CategoricalDtype(MARITAL_STATUSES),
+    'Dt_Customer': 'datetime64[ns]',
+    'Age': 'int16',
+    'TotalSpent': 'int32',
+    'TotalPurchases': 'int16',
+    'TotalChildren': 'int8',
+    'TotalCampaignsAccepted': 'int8',
+    'CustomerTenureDays': 'Int32',
+    'CLV': 'float64',
+    'IncomeGroup': CategoricalDtype(INCOME_LABELS, ordered=True),
+    'AgeGroup': CategoricalDtype(AGE_LABELS, ordered=True),
+    'CustomerSegment': 'int8',
+    # Labels depend on the model's k, so the categories come from the model
+    'CustomerSegmentLabel': 'category',
+}
+
+
+def read_dtypes(dtypes, columns=None):
+    """read_csv dtype= for `dtypes`; fixed categoricals are read as plain
+    categories and checked by apply_schema, since read_csv would silently
+    turn unknown values into NaN."""
+    return {
+        col: 'category' if isinstance(dtype, CategoricalDtype) else dtype
+        for col, dtype in dtypes.items()
+        if col not in DATE_COLUMNS and (columns is None or col in columns)
+    }
+
+
+def nullable_integers(df):
+    """Convert the extract's integer columns, read as float64, to the nullable
+    integers of RAW_DTYPES, in place. Fails like an integer read would on a
+    fractional or out-of-range value."""
+    for col, dtype in INTEGER_DTYPES.items():
+        if col not in df.columns:
+            continue
+        values = df[col].to_numpy(dtype='float64')
+        missing = np.isnan(values)
+        values = np.where(missing, 0, values)
+        ints = values.astype(dtype)
+        if (ints != values).any():
+            raise ValueError(f"{col} has values that are not {dtype} integers: "
+                             f"{sorted(set(values[ints != values].tolist()))[:5]}")
+        df[col] = pd.arrays.IntegerArray(ints, missing)
+    return df
+
+
+def apply_schema(df, dtypes=CLEANED_DTYPES):
+    """Cast the columns of `df` that the schema declares, in place."""
+    for col, dtype in dtypes.items():
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        if isinstance(dtype, CategoricalDtype) and dtype.categories is not None:
+            unknown = set(df[col].dropna().unique()) - set(dtype.categories)
+            if unknown:
+                raise ValueError(f"{col} has values outside the schema: {sorted(map(str, unknown))}")
+        df[col] = df[col].astype(dtype)
+    return df
+
+
+def memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 2 ** 20
+
+
+def log_memory(df, label='Frame'):
+    print(f"   • {label}: {len(df):,} rows x {len(df.columns)} columns, {memory_mb(df):,.1f} MB in memory")
@@ -0,0 +1,344 @@
+"""Persisted RFM segmentation model.
+
+The fitted StandardScaler parameters and K-Means centroids are saved as a small
+JSON artifact so that the cleaning stage and the scoring API assign new
+customers to the same segments without refitting on the full population.
+Every fit is written as `segmentation_<version>.json` and also copied to
+`segmentation_latest.json`, which is the file loaded by default.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+MODEL_DIR = os.getenv('SEGMENTATION_MODEL_DIR', '/app/models')
+LATEST_MODEL = 'segmentation_latest.json'
+
+RFM_COLS = ['Recency', 'TotalPurchases', 'TotalSpent']
+SEGMENT_LABELS = {0: 'Champions', 1: 'At Risk', 2: 'Potential', 3: 'Lost'}
+
+
+def parse_k(value):
+    """'4' -> [4], '2-8' -> [2, ..., 8], '3,4,6' -> [3, 4, 6]."""
+    if '-' in value:
+        low, high = value.split('-', 1)
+        k_values = list(range(int(low), int(high) + 1))
+    else:
+        k_values = [int(k) for k in value.split(',')]
+    if not k_values or min(k_values) < 2:
+        raise argparse.ArgumentTypeError(f"invalid k range '{value}' (every k must be >= 2)")
+    return k_values
+
+
+def add_model_args(parser):
+    """Segmentation options shared by 01_data_cleaning.py and this module's CLI."""
+    parser.add_argument('--model-dir', default=MODEL_DIR,
+                        help="Where the segmentation model is read from and saved to")
+    parser.add_argument('--k', type=parse_k, default=[4],
+                        help="Number of segments, or candidates to choose from by silhouette "
+                             "(e.g. 2-8 or 3,4,5); default 4")
+    parser.add_argument('--algorithm', choices=['kmeans', 'minibatch'], default='kmeans',
+                        help="'minibatch' fits MiniBatchKMeans, for large populations")
+    parser.add_argument('--batch-size', type=int, default=4096,
+                        help="MiniBatchKMeans batch size")
+    parser.add_argument('--workers', type=int,
+                        help="Processes used to evaluate candidate k values (default: one per k, up to CPU count)")
+    parser.add_argument('--silhouette-sample', type=int, default=10000,
+                        help="Rows sampled for each silhouette score")
+
+
+def fit_from_args(args, rfm, income_median=None):
+    return fit_model(rfm, k_values=args.k, algorithm=args.algorithm, batch_size=args.batch_size,
+                     sample_size=args.silhouette_sample, workers=args.workers,
+                     income_median=income_median)
+
+
+def _cluster(rfm_scaled, k, algorithm, random_state, n_init, batch_size):
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+
+    if algorithm == 'minibatch':
+        return MiniBatchKMeans(n_clusters=k, random_state=random_state, n_init=n_init,
+                               batch_size=batch_size).fit(rfm_scaled)
+    return KMeans(n_clusters=k, random_state=random_state, n_init=n_init).fit(rfm_scaled)
+
+
+def evaluate_k(rfm_scaled, k, algorithm='kmeans', random_state=42, n_init=10,
+               batch_size=4096, sample_size=10000):
+    """Fit one candidate k; returns its centroids, inertia and sampled silhouette."""
+    from sklearn.metrics import silhouette_score
+
+    started = time.perf_counter()
+    clusterer = _cluster(rfm_scaled, k, algorithm, random_state, n_init, batch_size)
+    fit_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    # Same random_state for every k, so all candidates are scored on the same sample
+    silhouette = silhouette_score(rfm_scaled, clusterer.labels_,
+                                  sample_size=min(sample_size, len(rfm_scaled)),
+                                  random_state=random_state)
+    return {
+        'k': k,
+        'centroids': clusterer.cluster_centers_,
+        'inertia': float(clusterer.inertia_),
+        'silhouette': float(silhouette),
+        'fit_seconds': fit_seconds,
+        'score_seconds': time.perf_counter() - started,
+    }
+
+
+def select_k(rfm_scaled, k_values, workers=None, **options):
+    """Evaluate every candidate k across a process pool; the best silhouette wins."""
+    if len(k_values) == 1 or workers == 1:
+        results = [evaluate_k(rfm_scaled, k, **options) for k in k_values]
+    else:
+        with ProcessPoolExecutor(max_workers=workers or min(len(k_values), os.cpu_count())) as pool:
+            futures = [pool.submit(evaluate_k, rfm_scaled, k, **options) for k in k_values]
+            results = [future.result() for future in futures]
+    best = max(results, key=lambda result: result['silhouette'])
+    return best, results
+
+
+def print_k_report(results, best_k):
+    print(f"     {'k':>3} {'inertia':>14} {'silhouette':>11} {'fit':>9} {'score':>9}")
+    for result in results:
+        marker = '  <- selected' if result['k'] == best_k else ''
+        print(f"     {result['k']:>3} {result['inertia']:>14,.1f} {result['silhouette']:>11.4f} "
+              f"{result['fit_seconds']:>8.2f}s {result['score_seconds']:>8.2f}s{marker}")
+
+
+def fit_model(rfm, k_values=(4,), algorithm='kmeans', random_state=42, n_init=10,
+              batch_size=4096, sample_size=10000, workers=None, income_median=None):
+    """Fit the scaler and clustering on an (n, 3) Recency/Frequency/Monetary matrix.
+
+    With a single k and full-batch K-Means this is the original fit; otherwise
+    each k in `k_values` is evaluated in parallel and the best one is kept.
+    """
+    from sklearn.preprocessing import StandardScaler
+
+    scaler = StandardScaler()
+    rfm_scaled = scaler.fit_transform(rfm)
+    k_values = list(k_values)
+    params = {'algorithm': algorithm, 'random_state': random_state, 'n_init': n_init}
+    if algorithm == 'minibatch':
+        params['batch_size'] = batch_size
+
+    if len(k_values) == 1:
+        clusterer = _cluster(rfm_scaled, k_values[0], algorithm, random_state, n_init, batch_size)
+        best = {'k': k_values[0], 'centroids': clusterer.cluster_centers_,
+                'inertia': float(clusterer.inertia_)}
+        results = []
+    else:
+        best, results = select_k(rfm_scaled, k_values, workers=workers, sample_size=sample_size,
+                                 **{**params, 'batch_size': batch_size})
+
+    return build_model(scaler, best, params, len(rfm_scaled), results, income_median)
+
+
+def build_model(scaler, best, params, n_samples, results=(), income_median=None):
+    """The saved model artifact for a fitted scaler and the chosen k."""
+    model = {
+        'features': RFM_COLS,
+        'scaler_mean': scaler.mean_.tolist(),
+        'scaler_scale': scaler.scale_.tolist(),
+        'centroids': best['centroids'].tolist(),
+        'labels': {str(i): SEGMENT_LABELS.get(i, f"Segment {i + 1}") for i in range(best['k'])},
+        'income_median': income_median,
+        'n_samples': int(n_samples),
+        'inertia': best['inertia'],
+        'params': {'n_clusters': best['k'], **params},
+        'k_selection': [
+            {key: value for key, value in result.items() if key != 'centroids'}
+            for result in results
+        ],
+    }
+    digest = hashlib.sha256(json.dumps(model, sort_keys=True).encode()).hexdigest()
+    model['version'] = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{digest[:12]}"
+    return model
+
+
+class StreamingFit:
+    """Scaler and MiniBatchKMeans fitted chunk by chunk, for populations that
+    are read as a stream and never held in memory at once.
+
+    Every chunk goes through `scale()` in a first pass and through `cluster()`
+    in a second one, since the clusters are fitted on scaled features. Rows
+    are fed to each candidate k in `batch_size` batches. A random sample of
+    `sample_size` scaled rows, kept by reservoir sampling, scores the
+    candidates by silhouette and estimates their inertia.
+    """
+
+    def __init__(self, k_values=(4,), random_state=42, batch_size=4096, sample_size=10000):
+        from sklearn.cluster import MiniBatchKMeans
+        from sklearn.preprocessing import StandardScaler
+
+        self.scaler = StandardScaler()
+        self.clusterers = {k: MiniBatchKMeans(n_clusters=k, random_state=random_state, batch_size=batch_size)
+                           for k in k_values}
+        self.params = {'algorithm': 'minibatch', 'random_state': random_state, 'batch_size': batch_size,
+                       'streamed': True}
+        self.batch_size = batch_size
+        self.sample_size = sample_size
+        self.sample = np.empty((0, len(RFM_COLS)))
+        self.n_samples = 0
+        self._pending = np.empty((0, len(RFM_COLS)))
+        self._rng = np.random.default_rng(random_state)
+        # Time spent fitting, shared by every k, and per k; reading the file is not counted
+        self._shared_seconds = 0.0
+        self._fit_seconds = dict.fromkeys(self.clusterers, 0.0)
+
+    def scale(self, rfm):
+        if len(rfm):
+            started = time.perf_counter()
+            self.scaler.partial_fit(rfm)
+            self._shared_seconds += time.perf_counter() - started
+
+    def cluster(self, rfm):
+        started = time.perf_counter()
+        scaled = self.scaler.transform(rfm)
+        self._keep_sample(scaled)
+        self.n_samples += len(scaled)
+        self._pending = np.concatenate([self._pending, scaled])
+        self._shared_seconds += time.perf_counter() - started
+        full = len(self._pending) - len(self._pending) % self.batch_size
+        for start in range(0, full, self.batch_size):
+            self._partial_fit(self._pending[start:start + self.batch_size])
+        self._pending = self._pending[full:]
+
+    def _partial_fit(self, batch):
+        for k, clusterer in self.clusterers.items():
+            started = time.perf_counter()
+            clusterer.partial_fit(batch)
+            self._fit_seconds[k] += time.perf_counter() - started
+
+    def _keep_sample(self, scaled):
+        # Algorithm R: row i of the stream replaces a random slot with probability size / (i + 1)
+        room = max(self.sample_size - len(self.sample), 0)
+        self.sample = np.concatenate([self.sample, scaled[:room]])
+        rest = scaled[room:]
+        if len(rest):
+            seen = self.n_samples + room + np.arange(len(rest))
+            slots = (self._rng.random(len(rest)) * (seen + 1)).astype('int64')
+            kept = slots < self.sample_size
+            self.sample[slots[kept]] = rest[kept]
+
+    def model(self, income_median=None):
+        """The fitted model, with the best silhouette if several k were candidates."""
+        from sklearn.metrics import silhouette_score
+
+        if self.n_samples < max(self.clusterers):
+            raise ValueError(f"{self.n_samples} customers are too few for k={max(self.clusterers)}")
+        if len(self._pending):
+            self._partial_fit(self._pending)
+            self._pending = self._pending[:0]
+
+        results = []
+        for k, clusterer in self.clusterers.items():
+            started = time.perf_counter()
+            distances = ((self.sample[:, None, :] - clusterer.cluster_centers_) ** 2).sum(axis=2)
+            labels = distances.argmin(axis=1)
+            result = {
+                'k': k,
+                'centroids': clusterer.cluster_centers_,
+                'inertia': float(distances.min(axis=1).sum() * self.n_samples / len(self.sample)),
+            }
+            if len(self.clusterers) > 1:
+                result['silhouette'] = float(silhouette_score(self.sample, labels))
+                result['fit_seconds'] = self._shared_seconds + self._fit_seconds[k]
+                result['score_seconds'] = time.perf_counter() - started
+            results.append(result)
+        best = max(results, key=lambda result: result.get('silhouette', 0))
+        return build_model(self.scaler, best, self.params, self.n_samples,
+                           results if len(results) > 1 else [], income_median)
+
+
+def save_model(model, model_dir=MODEL_DIR):
+    os.makedirs(model_dir, exist_ok=True)
+    payload = json.dumps(model, indent=2)
+    path = os.path.join(model_dir, f"segmentation_{model['version']}.json")
+    # The API reloads the latest model when its mtime changes, so each file is
+    # written beside its target and renamed over it: readers never see half of it.
+    for target in (path, os.path.join(model_dir, LATEST_MODEL)):
+        partial = target + '.tmp'
+        with open(partial, 'w') as f:
+            f.write(payload)
+        os.replace(partial, target)
+    return path
+
+
+def load_model(model_dir=MODEL_DIR, path=None):
+    """Load a saved model (the latest one by default); None if there is none yet."""
+    path = path or os.path.join(model_dir, LATEST_MODEL)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        model = json.load(f)
+    model['scaler_mean'] = np.asarray(model['scaler_mean'], dtype='float64')
+    model['scaler_scale'] = np.asarray(model['scaler_scale'], dtype='float64')
+    model['centroids'] = np.asarray(model['centroids'], dtype='float64')
+    model['labels'] = {int(k): v for k, v in model['labels'].items()}
+    return model
+
+
+def assign_segment(rfm, model):
+    """Nearest-centroid segment ids for an (n, 3) RFM matrix, in one NumPy pass."""
+    scaled = (np.asarray(rfm, dtype='float64') - model['scaler_mean']) / model['scaler_scale']
+    centroids = model['centroids']
+    # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2; ||x||^2 is the same for every c
+    distances = (centroids ** 2).sum(axis=1) - 2 * scaled @ centroids.T
+    return distances.argmin(axis=1)
+
+
+def segment_labels(segments, model):
+    names = np.asarray([model['labels'][i] for i in range(len(model['centroids']))], dtype=object)
+    return names[segments]
+
+
+def label_column(segments, model):
+    """segment_labels as a categorical over every label of the model, so that
+    chunks written one at a time share the same categories."""
+    import pandas as pd
+
+    return pd.Categorical(segment_labels(segments, model), categories=sorted(set(model['labels'].values())))
+
+
+def main():
+    from dataset_io import CLEANED_DATA_PATH, detect_format, read_cleaned, write_cleaned
+
+    parser = argparse.ArgumentParser(description="Fit and save the RFM segmentation model on the cleaned dataset")
+    parser.add_argument('--input', default=CLEANED_DATA_PATH,
+                        help="Cleaned dataset produced by 01_data_cleaning.py")
+    parser.add_argument('--apply', action='store_true',
+                        help="Rewrite the segment columns of the input with the new model")
+    add_model_args(parser)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("RFM SEGMENTATION")
+    print("=" * 60)
+    rfm = read_cleaned(args.input, columns=RFM_COLS + ['Income'])
+    started = time.perf_counter()
+    model = fit_from_args(args, rfm[RFM_COLS].to_numpy(dtype='float64'), float(rfm['Income'].median()))
+    print(f"\nFitted {model['params']['algorithm']} with k={model['params']['n_clusters']} on "
+          f"{model['n_samples']:,} customers in {time.perf_counter() - started:.2f}s")
+    if model['k_selection']:
+        print_k_report(model['k_selection'], model['params']['n_clusters'])
+    print(f"Saved to {save_model(model, args.model_dir)}")
+
+    if args.apply:
+        model = load_model(args.model_dir)
+        df = read_cleaned(args.input)
+        df['CustomerSegment'] = assign_segment(df[RFM_COLS].to_numpy(), model).astype('int8')
+        df['CustomerSegmentLabel'] = label_column(df['CustomerSegment'].to_numpy(), model)
+        partial = args.input + '.tmp'
+        write_cleaned(df, partial, detect_format(args.input))
+        os.replace(partial, args.input)
+        print(f"Re-segmented {len(df):,} customers in {args.input}")
+
+
+if __name__ == '__main__':
+    main()
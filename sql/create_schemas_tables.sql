@@ -19,9 +19,16 @@ CREATE TABLE IF NOT EXISTS staging.customers_raw (
   campaign_response TEXT,
   channel TEXT,
   date_sent TEXT,
-  ingested_at TIMESTAMP DEFAULT now()
+  ingested_at TIMESTAMP DEFAULT now(),
+  year_birth TEXT,
+  education TEXT,
+  marital_status TEXT,
+  content_hash TEXT
 );
 
+-- Incremental loads look up their own batch by file and load time
+CREATE INDEX IF NOT EXISTS customers_raw_batch_idx ON staging.customers_raw (source_file, ingested_at);
+
 -- Create analytics table
 CREATE TABLE IF NOT EXISTS analytics.customers (
   customer_id BIGINT PRIMARY KEY,
@@ -36,5 +43,10 @@ CREATE TABLE IF NOT EXISTS analytics.customers (
   month_sent INT,
   days_since_sent INT,
   created_at TIMESTAMP DEFAULT now(),
-  updated_at TIMESTAMP DEFAULT now()
+  updated_at TIMESTAMP DEFAULT now(),
+  education TEXT,
+  marital_status TEXT,
+  content_hash TEXT,
+  -- Reference date age and days_since_sent were computed as of
+  features_as_of DATE
 );
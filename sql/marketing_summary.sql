@@ -0,0 +1,50 @@
+-- ============================================================
+-- DASHBOARD SUMMARY AGGREGATES
+-- ============================================================
+-- One pass over marketing_campaigns producing every aggregate the API
+-- serves. The empty grouping set is the population-wide row ('overall');
+-- the others break the same measures down by segment, age group and
+-- income group.
+--
+-- 03_load_to_postgres.py materializes this query as marketing_summary at
+-- the end of every load, so unfiltered API requests never scan the base
+-- table. Filtered requests run it live against a CTE of the matching rows
+-- named marketing_campaigns, so it must stay a single SELECT over that name.
+
+SELECT
+    CASE
+        WHEN GROUPING(customer_segment_label) = 0 THEN 'segment'
+        WHEN GROUPING(age_group) = 0 THEN 'age_group'
+        WHEN GROUPING(income_group) = 0 THEN 'income_group'
+        ELSE 'overall'
+    END as level,
+    COALESCE(customer_segment_label, age_group, income_group) as group_value,
+    COUNT(*) as customers,
+    ROUND(SUM(total_spent), 2) as total_revenue,
+    ROUND(AVG(total_spent), 2) as avg_spending,
+    ROUND(AVG(clv), 2) as avg_clv,
+    ROUND(AVG(age), 0) as avg_age,
+    ROUND(AVG(income), 2) as avg_income,
+    ROUND(AVG(CASE WHEN total_campaigns_accepted > 0 THEN 1 ELSE 0 END) * 100, 2) as response_rate,
+    COUNT(*) FILTER (WHERE total_spent > 1000) as high_spenders,
+    SUM(accepted_cmp1) as cmp1_acceptances,
+    ROUND(AVG(accepted_cmp1) * 100, 2) as cmp1_rate,
+    SUM(accepted_cmp2) as cmp2_acceptances,
+    ROUND(AVG(accepted_cmp2) * 100, 2) as cmp2_rate,
+    SUM(accepted_cmp3) as cmp3_acceptances,
+    ROUND(AVG(accepted_cmp3) * 100, 2) as cmp3_rate,
+    SUM(accepted_cmp4) as cmp4_acceptances,
+    ROUND(AVG(accepted_cmp4) * 100, 2) as cmp4_rate,
+    SUM(accepted_cmp5) as cmp5_acceptances,
+    ROUND(AVG(accepted_cmp5) * 100, 2) as cmp5_rate,
+    SUM(mnt_wines) as wines_revenue,
+    SUM(mnt_meat_products) as meat_revenue,
+    SUM(mnt_fish_products) as fish_revenue,
+    SUM(mnt_gold_prods) as gold_revenue,
+    SUM(mnt_fruits) as fruits_revenue,
+    SUM(mnt_sweet_products) as sweets_revenue,
+    SUM(num_store_purchases) as store_purchases,
+    SUM(num_web_purchases) as web_purchases,
+    SUM(num_catalog_purchases) as catalog_purchases
+FROM marketing_campaigns
+GROUP BY GROUPING SETS ((), (customer_segment_label), (age_group), (income_group))
@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+import uuid
+
+import pandas as pd
+import psycopg2
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(REPO_DIR, 'scripts')
+SAMPLE_EXTRACT = os.path.join(REPO_DIR, 'data', 'marketing_campaign.csv')
+REFERENCE_DATE = '2024-01-01'
+
+sys.path.insert(0, SCRIPTS_DIR)
+
+
+def run_script(name, *args, env=None):
+    """Run one of the pipeline scripts; fails the test with its output if it exits non-zero."""
+    result = subprocess.run([sys.executable, os.path.join(SCRIPTS_DIR, name), *map(str, args)],
+                            capture_output=True, text=True, env={**os.environ, **(env or {})})
+    assert result.returncode == 0, f"{name} exited {result.returncode}\n{result.stdout}\n{result.stderr}"
+    return result
+
+
+@pytest.fixture
+def make_extract(tmp_path):
+    """Write the first `rows` customers of the sample extract, with `blanks`
+    ({column: [row positions]}) emptied, and return its path."""
+    def make(rows=40, blanks=None):
+        df = pd.read_csv(SAMPLE_EXTRACT, sep=';', encoding='utf-8-sig', dtype=str, keep_default_na=False,
+                         nrows=rows)
+        for column, positions in (blanks or {}).items():
+            df.loc[positions, column] = ''
+        path = tmp_path / 'extract.csv'
+        df.to_csv(path, sep=';', index=False)
+        return path
+    return make
+
+
+@pytest.fixture
+def clean_extract(tmp_path):
+    """Clean an extract with 01_data_cleaning.py into a CSV, fitting a fresh model."""
+    def clean(extract, *args):
+        output = tmp_path / 'cleaned.csv'
+        run_script('01_data_cleaning.py', '--input', extract, '--output', output,
+                   '--model-dir', tmp_path / 'models', '--refit', '--reference-date', REFERENCE_DATE, *args)
+        return output
+    return clean
+
+
+@pytest.fixture
+def scratch_db():
+    """An empty database on the configured Postgres server, dropped afterwards."""
+    params = {
+        'host': os.getenv('POSTGRES_HOST', 'localhost'),
+        'port': os.getenv('POSTGRES_PORT', '5432'),
+        'user': os.getenv('POSTGRES_USER', 'postgres'),
+        'password': os.getenv('POSTGRES_PASSWORD', 'postgres'),
+    }
+    try:
+        admin = psycopg2.connect(dbname='postgres', connect_timeout=3, **params)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"Postgres is not available: {e}")
+    admin.autocommit = True
+    name = f"marketing_test_{uuid.uuid4().hex[:8]}"
+    with admin.cursor() as cursor:
+        cursor.execute(f"CREATE DATABASE {name}")
+    conn = psycopg2.connect(dbname=name, **params)
+    try:
+        yield conn, {'POSTGRES_DB': name}
+    finally:
+        conn.close()
+        with admin.cursor() as cursor:
+            cursor.execute(f"DROP DATABASE {name} WITH (FORCE)")
+        admin.close()
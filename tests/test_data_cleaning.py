@@ -0,0 +1,16 @@
+import pytest
+
+from dataset_io import read_cleaned
+
+
+@pytest.mark.parametrize('options', [[], ['--chunk-size', 7]], ids=['in-memory', 'chunked'])
+def test_blank_birth_year_and_count_rows_are_dropped(make_extract, clean_extract, options):
+    # Rows 2 and 3 are customers 4141 and 6182
+    extract = make_extract(rows=30, blanks={'Year_Birth': [2], 'Recency': [3]})
+
+    df = read_cleaned(clean_extract(extract, *options))
+
+    assert len(df) == 28
+    assert not df['ID'].isin([4141, 6182]).any()
+    assert df['Year_Birth'].dtype == 'int16'
+    assert df['Recency'].dtype == 'int16'
@@ -0,0 +1,35 @@
+import pytest
+
+from conftest import run_script
+
+
+@pytest.mark.parametrize('mode', ['copy', 'insert'])
+def test_customer_without_enrollment_date_is_loaded(make_extract, clean_extract, scratch_db, mode):
+    conn, env = scratch_db
+    cleaned = clean_extract(make_extract(rows=40, blanks={'Dt_Customer': [0]}))
+
+    run_script('03_load_to_postgres.py', '--input', cleaned, '--mode', mode, env=env)
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*), COUNT(dt_customer), COUNT(DISTINCT id) FROM marketing_campaigns")
+        assert cursor.fetchone() == (40, 39, 40)
+        cursor.execute("SELECT id, customer_tenure_days FROM marketing_campaigns_default")
+        assert cursor.fetchall() == [(5524, None)]
+        cursor.execute("SELECT SUM(customers) FROM cohort_monthly")
+        assert cursor.fetchone()[0] == 39
+        cursor.execute("SELECT customers FROM marketing_summary WHERE level = 'overall'")
+        assert cursor.fetchone()[0] == 40
+
+
+def test_extract_without_any_enrollment_date_loads_into_default_partition(make_extract, clean_extract,
+                                                                           scratch_db):
+    conn, env = scratch_db
+    cleaned = clean_extract(make_extract(rows=20, blanks={'Dt_Customer': list(range(20))}))
+
+    run_script('03_load_to_postgres.py', '--input', cleaned, env=env)
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM marketing_campaigns_default")
+        assert cursor.fetchone()[0] == 20
+        cursor.execute("SELECT COUNT(*) FROM cohort_monthly")
+        assert cursor.fetchone()[0] == 0